@@ -0,0 +1,1052 @@
+# -*- coding: utf-8 -*-
+# (C) 2018 Lukas Pilz & Conrad Sachweh
+
+"""
+Tree search agent playing the game on top of the display-free simulation.
+"""
+
+from collections import OrderedDict
+from functools import lru_cache
+import concurrent.futures
+import heapq
+from itertools import count
+from math import ceil, log2
+from operator import itemgetter
+import time
+import numpy as np
+
+import instrumentation
+from simulation import (FPS, AGENT_FREQ, SCREENWIDTH, BASEY, PIPEGAPSIZE, PLAYER_X, PIPE_VEL_X, FRAME_SKIP,
+                        PLAYER_WIDTH, PLAYER_HEIGHT, PIPE_WIDTH, PIPE_HEIGHT, PLAYER_MAX_VEL_Y, PLAYER_ACC_Y,
+                        PLAYER_FLAP_ACC, COLLISION_TABLE_ANY,
+                        GameState, checkCrashBatch, getScoreParameters, scoreFunction)
+
+NUM_PATHS_VISIBLE = 5
+MAX_VISIBLE_DEPTH = (SCREENWIDTH - PLAYER_X) / abs(PIPE_VEL_X) / FRAME_SKIP
+
+MAX_DESIRED_DEPTH = 19
+MAX_DEPTH = min(MAX_DESIRED_DEPTH, MAX_VISIBLE_DEPTH)
+TRANSPOSITION_SIZE = 200000
+# share of the time between two decisions the AnytimeAgent may search
+DECISION_BUDGET = 0.8 * AGENT_FREQ / FPS
+
+# player positions covered by the grid of the DynamicPlanner, lower ones are unreachable
+GRID_Y_MIN = -128
+GRID_Y_MAX = int(BASEY - PLAYER_HEIGHT) + 1
+
+# range of the player's y relative to the top of a pipe gap covered by GAP_SAFE
+GAP_R_MIN = GRID_Y_MIN - int(BASEY)
+GAP_R_MAX = int(BASEY) + 1
+
+# marks a missing entry of the transposition table, None is a valid value
+MISSING = object()
+
+# scoreFunction of a single displacement, the bounds of the search only need a few distinct ones
+tickScore = lru_cache(maxsize=4096)(scoreFunction)
+
+# breaks ties between leaves of the same score in the heap of the search
+LEAF_ORDER = count()
+
+def unlinkPath(pos_hist):
+    """turns a position history linked as (y, parent) tuples into a list, oldest position first"""
+    path = []
+    while pos_hist is not None:
+        y, pos_hist = pos_hist
+        path.append(y)
+    path.reverse()
+    return path
+
+def pushPath(best_paths, score, pos_hist):
+    """
+    offers a leaf to the min-heap of the NUM_PATHS_VISIBLE best leaves, its root
+    best_paths[0] is the worst leaf kept. The path is only unlinked once the search
+    is done, see bestPaths.
+
+    arguments:
+        best_paths   (list)  - heap of (score, tie breaker, linked position history)
+        score        (float) - score of the leaf
+        pos_hist     (tuple) - position history of the leaf, linked as (y, parent) tuples
+    returns:
+        none
+    """
+    if len(best_paths) < NUM_PATHS_VISIBLE:
+        heapq.heappush(best_paths, (score, next(LEAF_ORDER), pos_hist))
+    elif score > best_paths[0][0]:
+        heapq.heapreplace(best_paths, (score, next(LEAF_ORDER), pos_hist))
+
+def bestPaths(best_paths):
+    """turns a heap filled by pushPath into a list of scores with position histories, best first"""
+    return [(score, unlinkPath(pos_hist)) for score, _, pos_hist in sorted(best_paths, key=itemgetter(0, 1), reverse=True)]
+
+def buildEnvelope(ticks):
+    """
+    Computes how far the player can move within the next ticks. Flapping every
+    tick gives the highest position reachable, never flapping the lowest, so
+    every path from a state stays between both. The highest one ignores that
+    flaps above the screen have no effect and the lowest one ignores the ground,
+    which only widens the envelope.
+
+    arguments:
+        ticks        (int)  - number of ticks to compute
+    returns:
+        up           (list) - lowest displacement after each number of ticks, the same for every velocity
+        down         (list) - per velocity index (velocity - PLAYER_FLAP_ACC), highest displacement after each number of ticks
+    """
+    def displacements(player_vel_y, flap):
+        player_y, result = 0, [0]
+        for _ in range(ticks):
+            for frame in range(FRAME_SKIP):
+                flapped = flap and not frame
+                if flapped:
+                    player_vel_y = PLAYER_FLAP_ACC
+                if player_vel_y < PLAYER_MAX_VEL_Y and not flapped:
+                    player_vel_y += PLAYER_ACC_Y
+                player_y += player_vel_y
+            result.append(player_y)
+        return result
+
+    up = displacements(PLAYER_FLAP_ACC, True)
+    down = [displacements(player_vel_y, False) for player_vel_y in range(PLAYER_FLAP_ACC, PLAYER_MAX_VEL_Y + 1)]
+    return up, down
+
+def buildGapTable():
+    """
+    Counts the player positions that collide with neither part of a pipe, from
+    the collision table. The ground is left out, a position passing the table is
+    not necessarily safe, but every one failing it crashes.
+
+    arguments:
+        none
+    returns:
+        safe         (list) - per horizontal offset dx as in buildCollisionTable, the number
+                              of safe positions below each y - gap_y from GAP_R_MIN, as prefix sums
+    """
+    offset = np.arange(GAP_R_MIN, GAP_R_MAX)
+    tableHeight = PLAYER_HEIGHT + PIPE_HEIGHT - 1
+    safe = np.ones((PLAYER_WIDTH + PIPE_WIDTH - 1, len(offset)), dtype=bool)
+
+    # offsets of the upper pipe ending and the lower pipe starting at the gap, as in checkCrashAnyFrame
+    for pipe, dy in ((0, -offset - 1), (1, PIPEGAPSIZE - offset + PIPE_HEIGHT - 1)):
+        inside = (dy >= 0) & (dy < tableHeight)
+        safe &= ~(inside & COLLISION_TABLE_ANY[pipe][:, np.clip(dy, 0, tableHeight - 1)])
+
+    prefix = np.zeros((len(safe), len(offset) + 1), dtype=int)
+    prefix[:, 1:] = np.cumsum(safe, axis=1)
+    return prefix.tolist()
+
+ENVELOPE_UP, ENVELOPE_DOWN = buildEnvelope(int(MAX_VISIBLE_DEPTH) + 1)
+GAP_SAFE = buildGapTable()
+
+class SearchTimeout(Exception):
+    """raised inside the tree search once the deadline of the decision passed"""
+
+class TranspositionTable():
+    """
+    Bounded cache of search results, evicting the least recently used entry once
+    full. It is kept by the agent across decisions, as consecutive decisions
+    search mostly the same future.
+    """
+    def __init__(self, size=TRANSPOSITION_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=MISSING):
+        """returns the entry for key, default if there is none"""
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """stores value for key, evicting the least recently used entry if full"""
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+class Agent():
+    def __init__(self):
+        self.table = TranspositionTable()
+        self.depth = int(MAX_DEPTH)
+        self.deadline = None
+
+    def statistics(self):
+        """returns counters of the agent's search, cumulative over all decisions"""
+        return {
+            'transposition_hits': self.table.hits,
+            'transposition_misses': self.table.misses,
+            'transposition_entries': len(self.table.entries),
+        }
+
+    def close(self):
+        """releases the resources of the agent"""
+        pass
+
+    def advance(self, state, flap, key):
+        """
+        GameState.advance looking up the outcome in the transposition table first
+
+        arguments:
+            state        (GameState) - state to advance
+            flap         (bool)      - whether or not the player flaps
+            key          (tuple)     - quantized state as built by search
+        returns:
+            state        (GameState) - new game state, None if the player crashes
+        """
+        step_key = ('step', flap) + key
+        outcome = self.table.get(step_key)
+        if outcome is MISSING:
+            child = state.advance(flap)
+            self.table.put(step_key, None if child is None else (child.player_y, child.player_vel_y))
+            return child
+        if outcome is None:
+            return None
+        return state.child(outcome[0], outcome[1], state.shift + FRAME_SKIP * PIPE_VEL_X)
+
+    def search(self, state, depth, score, pos_hist, best_paths, bound=None):
+        """
+        depth-first branch and bound below state, keeping the NUM_PATHS_VISIBLE best
+        leaves in the heap best_paths. A subtree is abandoned as soon as even its upper
+        bound could not enter the full heap. Searched subtrees store an upper bound of
+        their best score in the transposition table, dead ones are skipped right away
+        and the child with the better bound is searched first.
+
+        arguments:
+            state        (GameState) - state to search from
+            depth        (int)       - number of ticks left to search
+            score        (float)     - score accumulated on the way to state
+            pos_hist     (tuple)     - position history linked to the parent's
+            best_paths   (list)      - heap of the best leaves found so far, see pushPath
+            bound        (float)     - scoreBound of state if the parent computed it already
+        returns:
+            bound        (float)     - upper bound of the best score reachable below state, None if every path crashes
+        """
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+
+        if depth <= 0:
+            pushPath(best_paths, score, pos_hist)
+            return 0
+
+        counters = instrumentation.COUNTERS
+        key = (round(state.player_y), state.player_vel_y, state.pipeKey())
+        value_key = ('value', depth) + key + (state.fallbackGoalKey(depth),)
+        known = self.table.get(value_key)
+        if known is None:
+            if counters is not None:
+                counters['pruned'] += 1
+            return None
+        if known is MISSING:
+            if self.cannotPass(state, depth, key[2]):
+                if counters is not None:
+                    counters['envelope_cuts'] += 1
+                self.table.put(value_key, None)
+                return None
+            if bound is None:
+                bound = self.scoreBound(state, depth)
+        else:
+            bound = known
+
+        if len(best_paths) == NUM_PATHS_VISIBLE and score + bound <= best_paths[0][0]:
+            if counters is not None:
+                counters['bound_cuts'] += 1
+            return bound
+
+        if counters is not None:
+            counters['nodes'] += 1
+        children = []
+        for flap in (False, True):
+            child = self.advance(state, flap, key)
+            if child is not None:
+                child_key = ('value', depth - 1, round(child.player_y), child.player_vel_y, child.pipeKey(),
+                             child.fallbackGoalKey(depth - 1))
+                child_bound = self.table.entries.get(child_key, MISSING)
+                if child_bound is None:
+                    if counters is not None:
+                        counters['pruned'] += 1
+                    continue
+                if child_bound is MISSING:
+                    child_bound = self.scoreBound(child, depth - 1)
+                child_score = child.getScore()
+                children.append((child_score + child_bound, child_score, child_bound, child))
+
+        # the most promising child first fills the heap, ties keep not flapping first
+        if len(children) == 2 and children[1][0] > children[0][0]:
+            children.reverse()
+
+        bound = None
+        for _, child_score, child_bound, child in children:
+            child_bound = self.search(child, depth - 1, score + child_score,
+                                      (child.player_y, pos_hist), best_paths, child_bound)
+            if child_bound is not None and (bound is None or child_score + child_bound > bound):
+                bound = child_score + child_bound
+
+        # an earlier search may have bounded the subtree tighter
+        if bound is not None and known is not MISSING:
+            bound = min(bound, known)
+        self.table.put(value_key, bound)
+        return bound
+
+    def scoreBound(self, state, depth):
+        """
+        returns an upper bound of the score of every path of depth ticks below state:
+        no tick scores more than the position of the reachable envelope closest to
+        the goal of that tick
+
+        arguments:
+            state        (GameState) - state to bound
+            depth        (int)       - number of ticks left to search
+        returns:
+            bound        (float)     - the sum of the best score of every tick
+        """
+        player_y = state.player_y
+        down = ENVELOPE_DOWN[state.player_vel_y - PLAYER_FLAP_ACC]
+        bound = 0
+        for tick in range(1, depth + 1):
+            goal, cutoff = state.scoreParameters(state.shift + tick * FRAME_SKIP * PIPE_VEL_X)
+            displacement = max(0, player_y + ENVELOPE_UP[tick] - goal, goal - player_y - down[tick])
+            bound += tickScore(displacement, cutoff)
+        return bound
+
+    def cannotPass(self, state, depth, pipes):
+        """
+        checks whether every path below state crashes into one of the next pipes
+        within depth ticks: at the first tick the player overlaps a pipe, no
+        position of the reachable envelope fits through the gap
+
+        arguments:
+            state        (GameState) - state to check
+            depth        (int)       - number of ticks left to search
+            pipes        (tuple)     - x and y of the upper pipes ahead, as returned by pipeKey
+        returns:
+            dead         (bool)      - True if the subtree can be cut without searching it
+        """
+        player_y = state.player_y
+        down = ENVELOPE_DOWN[state.player_vel_y - PLAYER_FLAP_ACC]
+        tableWidth = PLAYER_WIDTH + PIPE_WIDTH - 1
+
+        for x, upper_y in pipes:
+            dx = x - PLAYER_X + PIPE_WIDTH - 1
+            tick = max(1, (dx - tableWidth) // (FRAME_SKIP * -PIPE_VEL_X) + 1)
+            if tick > depth:
+                return False
+            dx += tick * FRAME_SKIP * PIPE_VEL_X
+            if dx < 0:
+                continue # passed during the first tick
+
+            gapY = upper_y + PIPE_HEIGHT
+            low = int(max(player_y + ENVELOPE_UP[tick], GRID_Y_MIN)) - gapY - GAP_R_MIN
+            high = min(int(player_y + down[tick]) - gapY, GAP_R_MAX - 1) - GAP_R_MIN
+            safe = GAP_SAFE[dx]
+            if high < low or safe[high + 1] == safe[low]:
+                return True
+
+        return False
+
+    def getPathScore(self, state):
+        """
+        performs the tree search and returns the best NUM_PATHS_VISIBLE paths
+
+        arguments:
+            state        (GameState) - state from which to start the tree search
+        returns:
+            final_states (list)      - list of scores with corresponding position histories of the best NUM_PATHS_VISIBLE paths, best first
+        """
+        best_paths = []
+        self.search(state, self.depth, 0, (state.player_y, None), best_paths)
+        return bestPaths(best_paths)
+
+    def findBestDecision(self, state):
+        """
+        finds the best decision for the agent by performing two tree searches
+
+        arguments:
+            state        (GameState) - state for which to decide
+        returns:
+            flap         (bool)      - decision on whether or not to flap next
+            path         (list)      - list of position histories of the best NUM_PATHS_VISIBLE paths
+        """
+        flap_state = state.advance(True)
+        no_flap_state = state.advance(False)
+
+        if flap_state is None:
+            if no_flap_state is None:
+                return False, []
+            return False, self.getPathScore(no_flap_state)
+
+        if no_flap_state is None:
+            return True, self.getPathScore(flap_state)
+
+        return self.chooseDecision(self.getPathScore(flap_state), self.getPathScore(no_flap_state))
+
+    def chooseDecision(self, flap_states, no_flap_states):
+        """
+        compares the paths found after flapping and after not flapping
+
+        arguments:
+            flap_states    (list) - paths of the tree search after flapping
+            no_flap_states (list) - paths of the tree search after not flapping
+        returns:
+            flap           (bool) - decision on whether or not to flap next
+            path           (list) - list of scores with position histories of the best NUM_PATHS_VISIBLE paths, best first
+        """
+        best_traj = sorted(flap_states + no_flap_states, key=itemgetter(0), reverse=True)
+        best_traj = best_traj[:NUM_PATHS_VISIBLE]
+
+        # both lists are sorted best first, a side without any path has crashed for sure
+        flap_score = flap_states[0][0] if flap_states else -1
+        no_flap_score = no_flap_states[0][0] if no_flap_states else -1
+
+        return flap_score > no_flap_score, best_traj
+
+class AnytimeAgent(Agent):
+    """
+    Iterative deepening tree search: searches one tick deeper after the other,
+    up to the visible horizon, until the wall-clock deadline of the decision
+    passes, and returns the decision of the deepest search that completed.
+    """
+    def __init__(self, budget=DECISION_BUDGET):
+        super().__init__()
+        self.budget = budget
+        self.achieved_depth = 0
+
+    def statistics(self):
+        """returns counters of the agent's search, including the depth of the last decision"""
+        statistics = super().statistics()
+        statistics['depth'] = self.achieved_depth
+        return statistics
+
+    def findBestDecision(self, state):
+        """
+        finds the best decision for the agent within the time budget
+
+        arguments:
+            state        (GameState) - state for which to decide
+        returns:
+            flap         (bool)      - decision on whether or not to flap next
+            path         (list)      - list of position histories of the best NUM_PATHS_VISIBLE paths
+        """
+        deadline = time.perf_counter() + self.budget
+        result = False, []
+
+        # the shallowest search always completes, so there is a decision in any case
+        for depth in range(1, int(MAX_VISIBLE_DEPTH) + 1):
+            self.depth = depth
+            try:
+                result = super().findBestDecision(state)
+            except SearchTimeout:
+                break
+            self.achieved_depth = depth
+            self.deadline = deadline
+
+        self.deadline = None
+        return result
+
+# agent of a worker process of the ParallelAgent, created by initWorker()
+WORKER_AGENT = None
+
+def initWorker():
+    """
+    Prepares a worker process of the ParallelAgent. Importing this module loaded
+    the hitmasks and the collision table already, so the worker only needs its
+    agent, which keeps its transposition table for the lifetime of the worker.
+    """
+    global WORKER_AGENT
+    WORKER_AGENT = Agent()
+
+def searchSubtree(player_y, player_vel_y, upper_pipes, lower_pipes, shift, depth, score, pos_hist):
+    """
+    searches the subtree below a state in a worker process
+
+    arguments:
+        player_y     (float) - y position of the player
+        player_vel_y (int)   - velocity of the player
+        upper_pipes  (list)  - upper pipes of the snapshot
+        lower_pipes  (list)  - lower pipes of the snapshot
+        shift        (int)   - distance the pipes moved since the snapshot
+        depth        (int)   - number of ticks left to search
+        score        (float) - score accumulated on the way to the state
+        pos_hist     (list)  - position history on the way to the state
+    returns:
+        final_states (list)  - best NUM_PATHS_VISIBLE leaves of the subtree, as scores with position histories, best first
+    """
+    state = GameState(player_y, player_vel_y, upper_pipes, lower_pipes, shift)
+    linked = None
+    for y in pos_hist:
+        linked = (y, linked)
+
+    best_paths = []
+    WORKER_AGENT.search(state, depth, score, linked, best_paths)
+    return bestPaths(best_paths)
+
+class ParallelAgent(Agent):
+    """
+    Tree search spread over a pool of worker processes. The tree is split a few
+    ticks below both decisions and every subtree is searched by a worker; the
+    best leaves of all subtrees are merged into the best ones of the whole tree.
+    Each doubling of the workers buys one more tick of search depth.
+    """
+    def __init__(self, workers):
+        super().__init__()
+        self.workers = workers
+        self.depth = min(int(MAX_VISIBLE_DEPTH), int(MAX_DEPTH) + int(log2(workers)))
+        # enough subtrees per decision to keep all workers busy
+        self.split_depth = min(self.depth, ceil(log2(workers)) + 1)
+        self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=initWorker)
+
+    def statistics(self):
+        """returns counters of the agent's search, the workers keep their own tables"""
+        return {'workers': self.workers, 'depth': self.depth}
+
+    def splitTree(self, state):
+        """
+        returns the nodes split_depth ticks below state, in the order the sequential search visits them
+
+        arguments:
+            state        (GameState) - state to split the tree at
+        returns:
+            nodes        (list)      - states with their score and position history
+        """
+        nodes = [(state, 0, [state.player_y])]
+        for _ in range(self.split_depth):
+            expanded = []
+            for node, score, pos_hist in nodes:
+                for flap in (False, True):
+                    child = node.advance(flap)
+                    if child is not None:
+                        expanded.append((child, score + child.getScore(), pos_hist + [child.player_y]))
+            nodes = expanded
+        return nodes
+
+    def submitPathScore(self, state):
+        """starts the tree search below state on the workers, returns the futures of all subtrees"""
+        return [self.pool.submit(searchSubtree, node.player_y, node.player_vel_y, node.upper_pipes,
+                                 node.lower_pipes, node.shift, self.depth - self.split_depth, score, pos_hist)
+                for node, score, pos_hist in self.splitTree(state)]
+
+    def collectPathScore(self, futures):
+        """merges the best leaves of all subtrees into the best NUM_PATHS_VISIBLE ones of the whole tree"""
+        final_states = []
+        for future in futures:
+            final_states += future.result()
+
+        final_states.sort(key=itemgetter(0), reverse=True)
+        return final_states[:NUM_PATHS_VISIBLE]
+
+    def getPathScore(self, state):
+        return self.collectPathScore(self.submitPathScore(state))
+
+    def findBestDecision(self, state):
+        """
+        finds the best decision for the agent, searching both decisions on the workers at once
+
+        arguments:
+            state        (GameState) - state for which to decide
+        returns:
+            flap         (bool)      - decision on whether or not to flap next
+            path         (list)      - list of position histories of the best NUM_PATHS_VISIBLE paths
+        """
+        flap_state = state.advance(True)
+        no_flap_state = state.advance(False)
+
+        if flap_state is None:
+            if no_flap_state is None:
+                return False, []
+            return False, self.getPathScore(no_flap_state)
+
+        if no_flap_state is None:
+            return True, self.getPathScore(flap_state)
+
+        flap_futures = self.submitPathScore(flap_state)
+        no_flap_futures = self.submitPathScore(no_flap_state)
+
+        return self.chooseDecision(self.collectPathScore(flap_futures), self.collectPathScore(no_flap_futures))
+
+    def close(self):
+        """shuts the worker processes down"""
+        self.pool.shutdown()
+
+class BatchAgent(Agent):
+    """
+    Breadth-wise tree search expanding a whole level of the tree at once. The
+    players of a level live in NumPy arrays, the pipes are shared as they are the
+    same for every branch at the same depth. Branches reaching the same state at
+    the same depth have the same future, so only the better scoring one is kept.
+    """
+    def advance(self, player_y, player_vel_y, flap, upperPipes, lowerPipes, shift):
+        """
+        vectorized GameState.simulate for all branches of a level
+
+        arguments:
+            player_y     (ndarray) - y positions of the branches
+            player_vel_y (ndarray) - velocities of the branches
+            flap         (ndarray) - whether each branch flaps at the beginning of the tick
+            upperPipes   (list)    - upper pipes of the root state
+            lowerPipes   (list)    - lower pipes of the root state
+            shift        (int)     - distance the pipes moved since the root state
+        returns:
+            player_y     (ndarray) - new y positions
+            player_vel_y (ndarray) - new velocities
+            alive        (ndarray) - False where the branch crashed
+        """
+        alive = np.ones(len(player_y), dtype=bool)
+        flap = flap.copy()
+
+        for _ in range(FRAME_SKIP):
+            flapped = flap & (player_y > -2 * PLAYER_HEIGHT) # check if out of image
+            flap &= ~flapped
+            player_vel_y = np.where(flapped, PLAYER_FLAP_ACC, player_vel_y)
+
+            alive &= ~checkCrashBatch(player_y, upperPipes, lowerPipes, shift)
+
+            # player's movement
+            accelerate = (player_vel_y < PLAYER_MAX_VEL_Y) & ~flapped
+            player_vel_y = np.where(accelerate, player_vel_y + PLAYER_ACC_Y, player_vel_y)
+            player_y = player_y + np.minimum(player_vel_y, BASEY - player_y - PLAYER_HEIGHT)
+
+            shift += PIPE_VEL_X
+
+        alive &= ~checkCrashBatch(player_y, upperPipes, lowerPipes, shift)
+
+        return player_y, player_vel_y, alive
+
+    def findBestDecision(self, state):
+        """
+        finds the best decision for the agent by searching the tree level by level
+
+        arguments:
+            state        (GameState) - state for which to decide
+        returns:
+            flap         (bool)      - decision on whether or not to flap next
+            path         (list)      - list of scores with position histories of the best NUM_PATHS_VISIBLE paths, best first
+        """
+        upperPipes, lowerPipes = state.upper_pipes, state.lower_pipes
+
+        # the first level holds both decisions, every later level both children of each branch
+        player_y = np.full(2, state.player_y, dtype=float)
+        player_vel_y = np.full(2, state.player_vel_y, dtype=int)
+        flap = np.array([True, False])
+        first_flap = flap.copy()
+        score = np.zeros(2)
+        parent = np.zeros(2, dtype=int)
+        layers = []
+
+        for depth in range(int(MAX_DEPTH) + 1):
+            shift = state.shift + depth * FRAME_SKIP * PIPE_VEL_X
+            player_y, player_vel_y, alive = self.advance(player_y, player_vel_y, flap,
+                                                         upperPipes, lowerPipes, shift)
+
+            # like getPathScore, the decision itself is not scored
+            if depth:
+                goal, cutoff = getScoreParameters(upperPipes, shift + FRAME_SKIP * PIPE_VEL_X)
+                score = score + scoreFunction(np.abs(goal - player_y), cutoff)
+
+            # drop crashed branches, then merge equal states keeping the best score
+            order = np.flatnonzero(alive)
+            order = order[np.argsort(-score[order], kind='stable')]
+            key = (np.round(player_y[order]).astype(np.int64) * 64 + player_vel_y[order]) * 2 + first_flap[order]
+            _, unique = np.unique(key, return_index=True)
+            if instrumentation.COUNTERS is not None:
+                instrumentation.COUNTERS['nodes'] += len(unique)
+                instrumentation.COUNTERS['pruned'] += len(order) - len(unique)
+            order = order[np.sort(unique)]
+
+            player_y, player_vel_y = player_y[order], player_vel_y[order]
+            first_flap, score, parent = first_flap[order], score[order], parent[order]
+            layers.append((player_y, parent))
+
+            if not len(order) or depth == int(MAX_DEPTH):
+                break
+
+            # expand both children of every surviving branch
+            parent = np.repeat(np.arange(len(order)), 2)
+            player_y, player_vel_y = np.repeat(player_y, 2), np.repeat(player_vel_y, 2)
+            first_flap, score = np.repeat(first_flap, 2), np.repeat(score, 2)
+            flap = np.tile([True, False], len(order))
+
+        if depth < int(MAX_DEPTH) or not len(score):
+            return False, []
+
+        # leaves are sorted by score already
+        best_traj = []
+        for leaf in range(min(NUM_PATHS_VISIBLE, len(score))):
+            pos_hist, index = [], leaf
+            for layer_y, layer_parent in reversed(layers):
+                pos_hist.append(layer_y[index].item())
+                index = layer_parent[index]
+            best_traj.append((score[leaf].item(), pos_hist[::-1]))
+
+        flap_score = score[first_flap].max() if first_flap.any() else -1
+        no_flap_score = score[~first_flap].max() if not first_flap.all() else -1
+
+        return bool(flap_score > no_flap_score), best_traj
+
+class IncrementalAgent(BatchAgent):
+    """
+    Level-wise search keeping its frontier from one decision to the next. The
+    new root is a child of the previous one, so the leaves below that child are
+    kept, shortened by their first tick and searched one tick deeper, instead of
+    searching the whole tree again. Branches are merged per state and per their
+    first two decisions, so right after a new search the moved frontier still
+    holds the best branch to every state for both decisions of the new root.
+    Merges from before earlier moves may hide a branch, which makes later
+    decisions an approximation of a full search. The tree is searched from
+    scratch if the new root was not predicted, e.g. after a flap by hand, or if
+    a pipe appeared that the kept ticks were scored without.
+    """
+    def __init__(self):
+        super().__init__()
+        # per leaf and tick: y positions, velocities, flaps and scores; None before the first search
+        self.frontier = None
+        self.pipes = None
+        self.rebuilds = 0
+        self.reuses = 0
+
+    def statistics(self):
+        """returns counters of the agent's search, including how often the frontier was reused"""
+        statistics = super().statistics()
+        statistics['rebuilds'] = self.rebuilds
+        statistics['reuses'] = self.reuses
+        return statistics
+
+    def expand(self, frontier, upperPipes, lowerPipes, shift):
+        """
+        searches one tick deeper below every leaf of the frontier
+
+        arguments:
+            frontier     (tuple) - y positions, velocities, flaps and scores per leaf and tick
+            upperPipes   (list)  - upper pipes of the root state
+            lowerPipes   (list)  - lower pipes of the root state
+            shift        (int)   - distance the pipes moved since the root state at the start of the new tick
+        returns:
+            frontier     (tuple) - both children of every leaf, one tick longer
+            alive        (array) - False where the child crashed
+        """
+        player_y, player_vel_y, flaps, scores = frontier
+        parent = np.repeat(np.arange(len(player_y)), 2)
+        flap = np.tile([True, False], len(player_y))
+
+        child_y, child_vel_y, alive = self.advance(player_y[parent, -1], player_vel_y[parent, -1], flap,
+                                                   upperPipes, lowerPipes, shift)
+        goal, cutoff = getScoreParameters(upperPipes, shift + FRAME_SKIP * PIPE_VEL_X)
+        child_score = scoreFunction(np.abs(goal - child_y), cutoff)
+
+        return (np.column_stack((player_y[parent], child_y)),
+                np.column_stack((player_vel_y[parent], child_vel_y)),
+                np.column_stack((flaps[parent], flap)),
+                np.column_stack((scores[parent], child_score))), alive
+
+    def merge(self, frontier, alive):
+        """
+        drops crashed leaves and merges leaves in the same state after the same first two decisions
+
+        arguments:
+            frontier     (tuple) - y positions, velocities, flaps and scores per leaf and tick
+            alive        (array) - False where the leaf crashed
+        returns:
+            frontier     (tuple) - remaining leaves, best score first
+        """
+        player_y, player_vel_y, flaps, scores = frontier
+        order = np.flatnonzero(alive)
+        order = order[np.argsort(-scores[order].sum(axis=1), kind='stable')]
+
+        key = (np.round(player_y[order, -1]).astype(np.int64) * 64 + player_vel_y[order, -1]) * 2 + flaps[order, 0]
+        if flaps.shape[1] > 1:
+            key = key * 2 + flaps[order, 1]
+        _, unique = np.unique(key, return_index=True)
+        if instrumentation.COUNTERS is not None:
+            instrumentation.COUNTERS['nodes'] += len(unique)
+            instrumentation.COUNTERS['pruned'] += len(order) - len(unique)
+        order = order[np.sort(unique)]
+
+        return tuple(array[order] for array in frontier)
+
+    def rebuild(self, state, depth):
+        """searches the frontier of depth + 1 ticks below state from scratch"""
+        self.rebuilds += 1
+        root = (np.array([[state.player_y]]), np.array([[state.player_vel_y]]),
+                np.zeros((1, 1), dtype=bool), np.zeros((1, 1)))
+        frontier, alive = self.expand(root, state.upper_pipes, state.lower_pipes, state.shift)
+
+        # like getPathScore, the decision itself is not scored
+        player_y, player_vel_y, flaps, scores = (array[:, 1:] for array in frontier)
+        frontier = self.merge((player_y, player_vel_y, flaps, np.zeros_like(scores)), alive)
+
+        for tick in range(1, depth + 1):
+            if not len(frontier[0]):
+                break
+            shift = state.shift + tick * FRAME_SKIP * PIPE_VEL_X
+            frontier = self.merge(*self.expand(frontier, state.upper_pipes, state.lower_pipes, shift))
+        return frontier
+
+    def reuse(self, state, depth):
+        """
+        moves the root of the kept frontier to state and searches the newly visible tick
+
+        arguments:
+            state        (GameState) - state for which to decide
+            depth        (int)       - number of scored ticks below the decision
+        returns:
+            frontier     (tuple)     - the new frontier, None if the kept one does not lead to state
+        """
+        if self.frontier is None or self.frontier[0].shape[1] != depth + 1:
+            return None
+
+        # a pipe the kept ticks did not know of changes their scores
+        pipes = {(p['x'] + state.shift, p['y']) for p in state.upper_pipes}
+        if not pipes <= {(x + FRAME_SKIP * PIPE_VEL_X, y) for x, y in self.pipes}:
+            return None
+
+        player_y, player_vel_y, flaps, scores = self.frontier
+        below = (player_y[:, 0] == state.player_y) & (player_vel_y[:, 0] == state.player_vel_y)
+        if not below.any():
+            return None
+
+        self.reuses += 1
+        scores = scores[below, 1:].copy()
+        scores[:, 0] = 0
+        frontier = (player_y[below, 1:], player_vel_y[below, 1:], flaps[below, 1:], scores)
+
+        shift = state.shift + depth * FRAME_SKIP * PIPE_VEL_X
+        return self.merge(*self.expand(frontier, state.upper_pipes, state.lower_pipes, shift))
+
+    def findBestDecision(self, state):
+        """
+        finds the best decision for the agent, reusing the frontier of the previous decision if possible
+
+        arguments:
+            state        (GameState) - state for which to decide
+        returns:
+            flap         (bool)      - decision on whether or not to flap next
+            path         (list)      - list of scores with position histories of the best NUM_PATHS_VISIBLE paths, best first
+        """
+        depth = int(MAX_DEPTH)
+        frontier = self.reuse(state, depth)
+        if frontier is None:
+            frontier = self.rebuild(state, depth)
+
+        player_y, _, flaps, scores = frontier
+        if not len(player_y) or player_y.shape[1] != depth + 1:
+            self.frontier = None
+            return False, []
+        self.frontier = frontier
+        self.pipes = [(p['x'] + state.shift, p['y']) for p in state.upper_pipes]
+
+        # leaves are sorted by score already
+        score = scores.sum(axis=1)
+        best_traj = [(score[leaf].item(), player_y[leaf].tolist()) for leaf in range(min(NUM_PATHS_VISIBLE, len(score)))]
+
+        first_flap = flaps[:, 0]
+        flap_score = score[first_flap].max() if first_flap.any() else -1
+        no_flap_score = score[~first_flap].max() if not first_flap.all() else -1
+
+        return bool(flap_score > no_flap_score), best_traj
+
+class DynamicPlanner(BatchAgent):
+    """
+    Exact planner doing backward value iteration over a grid of every player
+    position and velocity. Where a state ends up after a tick does not depend on
+    the pipes, so the transitions are computed once; a decision only has to look
+    up crashes for the current pipes and sweep the horizon backwards, linear in
+    MAX_DEPTH instead of exponential.
+    """
+    def __init__(self):
+        super().__init__()
+        grid_y, grid_vel = np.meshgrid(np.arange(GRID_Y_MIN, GRID_Y_MAX),
+                                       np.arange(PLAYER_FLAP_ACC, PLAYER_MAX_VEL_Y + 1), indexing='ij')
+        self.grid_y, self.grid_vel = grid_y.ravel(), grid_vel.ravel()
+        self.num_vel = PLAYER_MAX_VEL_Y + 1 - PLAYER_FLAP_ACC
+
+        # per decision: positions at the start of every frame and after the tick,
+        # whether the tick survives the ground and the grid index it ends in
+        self.positions, self.next_index = {}, {}
+        for flap in (False, True):
+            positions, player_vel_y = self.simulateFrames(self.grid_y.astype(float), self.grid_vel, flap)
+            self.positions[flap] = positions
+            self.next_index[flap] = self.gridIndex(positions[-1], player_vel_y)
+
+    def simulateFrames(self, player_y, player_vel_y, flap):
+        """
+        moves players through one tick without checking for crashes
+
+        arguments:
+            player_y     (ndarray) - y positions
+            player_vel_y (ndarray) - velocities
+            flap         (bool)    - whether the players flap at the beginning of the tick
+        returns:
+            positions    (list)    - y positions at the start of every frame and after the tick
+            player_vel_y (ndarray) - velocities after the tick
+        """
+        flap = np.full(len(player_y), flap)
+        positions = []
+
+        for _ in range(FRAME_SKIP):
+            flapped = flap & (player_y > -2 * PLAYER_HEIGHT) # check if out of image
+            flap &= ~flapped
+            player_vel_y = np.where(flapped, PLAYER_FLAP_ACC, player_vel_y)
+            positions.append(player_y)
+
+            accelerate = (player_vel_y < PLAYER_MAX_VEL_Y) & ~flapped
+            player_vel_y = np.where(accelerate, player_vel_y + PLAYER_ACC_Y, player_vel_y)
+            player_y = player_y + np.minimum(player_vel_y, BASEY - player_y - PLAYER_HEIGHT)
+
+        positions.append(player_y)
+        return positions, player_vel_y
+
+    def gridIndex(self, player_y, player_vel_y):
+        """returns the grid index of each state, -1 where it lies off the grid"""
+        iy = np.round(player_y).astype(int) - GRID_Y_MIN
+        iv = np.asarray(player_vel_y) - PLAYER_FLAP_ACC
+        inside = (iy >= 0) & (iy < GRID_Y_MAX - GRID_Y_MIN) & (iv >= 0) & (iv < self.num_vel) \
+                 & (player_y == np.round(player_y))
+        return np.where(inside, iy * self.num_vel + iv, -1)
+
+    def findBestDecision(self, state):
+        """
+        finds the optimal decision for the agent by value iteration over the horizon
+
+        arguments:
+            state        (GameState) - state for which to decide
+        returns:
+            flap         (bool)      - decision on whether or not to flap next
+            path         (list)      - scores with position histories of the best path for both decisions, best first
+        """
+        upperPipes, lowerPipes = state.upper_pipes, state.lower_pipes
+        depth = int(MAX_DEPTH)
+
+        # crashes only depend on y, so they are computed once per pipe shift for all integer heights
+        heights = np.arange(GRID_Y_MIN + FRAME_SKIP * PLAYER_FLAP_ACC, int(BASEY) + 1)
+        crashes = {}
+        def crashed(positions, shift):
+            if shift not in crashes:
+                crashes[shift] = checkCrashBatch(heights.astype(float), upperPipes, lowerPipes, shift)
+            index = np.clip(np.trunc(positions).astype(int) - heights[0], 0, len(heights) - 1)
+            return (positions + PLAYER_HEIGHT >= BASEY - 1) | crashes[shift][index]
+
+        # value[i]: best score reachable from grid state i within the remaining ticks
+        value = np.zeros(len(self.grid_y))
+        policy = [None] * depth
+        for tick in reversed(range(depth)):
+            # tick + 1 ticks after the root, the root's own tick is handled below
+            shift = state.shift + (tick + 1) * FRAME_SKIP * PIPE_VEL_X
+            goal, cutoff = getScoreParameters(upperPipes, shift + FRAME_SKIP * PIPE_VEL_X)
+
+            q = []
+            for flap in (False, True):
+                positions, next_index = self.positions[flap], self.next_index[flap]
+                alive = next_index >= 0
+                for frame, player_y in enumerate(positions):
+                    alive &= ~crashed(player_y, shift + frame * PIPE_VEL_X)
+                score = scoreFunction(np.abs(goal - positions[-1]), cutoff)
+                q.append(np.where(alive, score + value[next_index], -np.inf))
+
+            policy[tick] = q[1] > q[0]
+            value = np.maximum(q[0], q[1])
+            if instrumentation.COUNTERS is not None:
+                instrumentation.COUNTERS['nodes'] += len(value)
+
+        # the root is off the grid in general, so its tick is simulated directly
+        best_traj = []
+        for flap in (False, True):
+            child = state.advance(flap)
+            if child is None:
+                continue
+            index = self.gridIndex(np.array([child.player_y]), np.array([child.player_vel_y]))[0]
+            if index < 0 or value[index] == -np.inf:
+                continue
+
+            score, pos_hist = value[index].item(), [child.player_y]
+            for tick in range(depth):
+                next_flap = policy[tick][index]
+                pos_hist.append(self.positions[next_flap][-1][index].item())
+                index = self.next_index[next_flap][index]
+            best_traj.append((score, pos_hist, flap))
+
+        if not best_traj:
+            return False, []
+
+        best_traj.sort(key=itemgetter(0), reverse=True)
+        return best_traj[0][2], [(score, pos_hist) for score, pos_hist, _ in best_traj]
+
+PLANNERS = {
+    'tree': Agent,
+    'anytime': AnytimeAgent,
+    'batch': BatchAgent,
+    'incremental': IncrementalAgent,
+    'dp': DynamicPlanner,
+}
+
+def fallbackDecision(state):
+    """
+    decides without searching, for a decision whose search missed its deadline:
+    takes the better scoring of the decisions that survive the next tick, not
+    flapping on a tie
+
+    arguments:
+        state        (GameState) - state for which to decide
+    returns:
+        flap         (bool)      - decision on whether or not to flap next
+    """
+    best_score, best_flap = None, False
+    for flap in (False, True):
+        child = state.advance(flap)
+        if child is not None and (best_score is None or child.getScore() > best_score):
+            best_score, best_flap = child.getScore(), flap
+    return best_flap
+
+class AsyncDecisions():
+    """
+    Runs the searches of an agent in a background thread, one tick ahead of the
+    game: while the game plays a tick, the agent decides on the state the tick
+    is predicted to end in. The deadline of a search is the frame its decision
+    is due; the game never waits for it, a late decision is replaced by
+    fallbackDecision() and its result is thrown away.
+    """
+    def __init__(self, agent):
+        self.agent = agent
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.future = None
+        # frame the running search decides for
+        self.frame = None
+
+    def reset(self):
+        """forgets the search running for the previous game"""
+        self.frame = None
+
+    def decide(self, state, frame):
+        """
+        returns the decision due at frame and starts the search for the next one
+
+        arguments:
+            state        (GameState) - state of the game at frame
+            frame        (int)       - number of the frame
+        returns:
+            flap         (bool)      - decision on whether or not to flap next
+            path         (list)      - paths of the search, empty for a fallback decision
+            late         (bool)      - whether the search missed its deadline
+        """
+        if self.frame == frame and self.future.done():
+            flap, path = self.future.result()
+            late = False
+        else:
+            flap, path = fallbackDecision(state), []
+            # a search for another frame was not missed, the game skipped its decision, e.g. above the screen
+            late = self.frame == frame
+
+        # a late search keeps the thread busy, the next one is queued to start as soon as it finished;
+        # a search still queued from the previous decision is for a frame that has passed
+        if self.future is not None:
+            self.future.cancel()
+        self.future = self.executor.submit(self.agent.findBestDecision, state.nextStep(flap))
+        self.frame = frame + AGENT_FREQ
+        return flap, path, late
+
+    def close(self):
+        """drops the queued search, waits for the running one and stops the thread"""
+        self.executor.shutdown(cancel_futures=True)
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# (C) 2018 Lukas Pilz & Conrad Sachweh
+
+"""
+Sprites of the game, read from disk once per process. All sprites with
+transparency, including every rotation of the player the game can show, are
+packed into a single atlas surface; a sprite is a subsurface of it. Starting a
+new game only picks other sprites and drawing a frame never transforms one.
+"""
+
+import pygame
+
+from simulation import PLAYERS_LIST, BACKGROUNDS_LIST, PIPES_LIST, assetPath
+
+# width of the atlas, the sprites are packed in rows of at most this width
+ATLAS_WIDTH = 1024
+
+def loadImage(path):
+    """returns the sprite at path, relative to the repository, converted for fast blits with alpha"""
+    return pygame.image.load(assetPath(path)).convert_alpha()
+
+def packAtlas(images):
+    """
+    Copies the images into one surface, row by row, the tallest ones first
+
+    arguments:
+        images       (dict)    - surfaces with per pixel alpha by name
+    returns:
+        atlas        (Surface) - the surface all images were copied to
+        sprites      (dict)    - subsurface of the atlas by name
+    """
+    positions = {}
+    x = y = row_height = 0
+    for name in sorted(images, key=lambda name: images[name].get_height(), reverse=True):
+        width, height = images[name].get_size()
+        if x + width > ATLAS_WIDTH:
+            x, y, row_height = 0, y + row_height, 0
+        positions[name] = (x, y)
+        x += width
+        row_height = max(row_height, height)
+
+    atlas = pygame.Surface((ATLAS_WIDTH, y + row_height), pygame.SRCALPHA).convert_alpha()
+    atlas.fill((0, 0, 0, 0))
+    sprites = {}
+    for name, position in positions.items():
+        # the atlas is transparent, taking the maximum copies the pixels including their alpha
+        rect = atlas.blit(images[name], position, special_flags=pygame.BLEND_RGBA_MAX)
+        sprites[name] = atlas.subsurface(rect)
+    return atlas, sprites
+
+class Sprites():
+    """
+    The sprite cache. Needs an initialized display, as every surface is
+    converted to its pixel format. player_angles are the rotations precomputed
+    for every frame of every player, crash_angles the additional ones of the
+    player frame shown by the game over screen.
+    """
+    def __init__(self, player_angles=(0,), crash_angles=()):
+        images = {}
+        for digit in range(10):
+            images['number', digit] = loadImage('assets/sprites/{}.png'.format(digit))
+        images['gameover'] = loadImage('assets/sprites/gameover.png')
+        images['message'] = loadImage('assets/sprites/message.png')
+        images['base'] = loadImage('assets/sprites/base.png')
+
+        for colour, paths in enumerate(PLAYERS_LIST):
+            for index, path in enumerate(paths):
+                frame = loadImage(path)
+                images['player', colour, index] = frame
+                angles = set(player_angles) | (set(crash_angles) if index == 1 else set())
+                for angle in angles:
+                    if angle % 360:
+                        images['player', colour, index, angle] = pygame.transform.rotate(frame, angle)
+
+        for colour, path in enumerate(PIPES_LIST):
+            pipe = loadImage(path)
+            images['pipe', colour, 0] = pygame.transform.rotate(pipe, 180)
+            images['pipe', colour, 1] = pipe
+
+        self.atlas, self.sprites = packAtlas(images)
+        self.backgrounds = tuple(pygame.image.load(assetPath(path)).convert() for path in BACKGROUNDS_LIST)
+
+        # rotated sprites by the unrotated one and the angle
+        self.rotations = {}
+        for name, sprite in self.sprites.items():
+            if name[0] == 'player' and len(name) == 4:
+                self.rotations[self.sprites[name[:3]], name[3]] = sprite
+
+    def __getitem__(self, name):
+        return self.sprites[name]
+
+    def numbers(self):
+        """returns the sprites of the digits 0 to 9"""
+        return tuple(self.sprites['number', digit] for digit in range(10))
+
+    def player(self, colour):
+        """returns the frames of the player of the given colour, an index into PLAYERS_LIST"""
+        return tuple(self.sprites['player', colour, index] for index in range(len(PLAYERS_LIST[colour])))
+
+    def pipe(self, colour):
+        """returns upper and lower pipe of the given colour, an index into PIPES_LIST"""
+        return self.sprites['pipe', colour, 0], self.sprites['pipe', colour, 1]
+
+    def rotated(self, sprite, angle):
+        """
+        returns sprite rotated by angle degrees; angles that were not precomputed
+        are rotated on first use and kept as well
+
+        arguments:
+            sprite       (Surface) - sprite of this cache
+            angle        (int)     - counterclockwise rotation in degrees
+        returns:
+            rotated      (Surface) - the rotated sprite
+        """
+        if not angle % 360:
+            return sprite
+        try:
+            return self.rotations[sprite, angle]
+        except KeyError:
+            rotated = self.rotations[sprite, angle] = pygame.transform.rotate(sprite, angle)
+            return rotated
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+# (C) 2018 Lukas Pilz & Conrad Sachweh
+
+"""
+Many independent games played in lockstep. Players and pipe queues of all
+games live in NumPy arrays, and one step() advances every game at once with
+the rules of flappy.mainGame: physics, pipe spawning, crash test and score.
+"""
+
+import numpy as np
+
+from simulation import (SCREENWIDTH, SCREENHEIGHT, PIPEGAPSIZE, BASEY, AGENT_FREQ, PLAYER_X, PIPE_VEL_X,
+                        PLAYER_VEL_Y, PLAYER_MAX_VEL_Y, PLAYER_ACC_Y, PLAYER_FLAP_ACC,
+                        PLAYER_WIDTH, PLAYER_HEIGHT, PIPE_WIDTH, PIPE_HEIGHT, COLLISION_TABLE, GameState)
+
+# a game never has more pipes at once, spawning waits until the first one is nearly gone
+MAX_PIPES = 4
+# frames of the player animation, as cycled in mainGame
+PLAYER_INDEX_CYCLE = np.array([0, 1, 2, 1])
+
+class BatchEnv():
+    """
+    N games advancing together. Each step applies one decision per game and
+    simulates `frames` frames, by default the AGENT_FREQ frames between two
+    decisions of the agent. Crashed games stay frozen until they are reset.
+    """
+    def __init__(self, num_games, seed=None, frames=AGENT_FREQ):
+        self.num_games = num_games
+        self.frames = frames
+        self.rng = np.random.default_rng(seed)
+
+        self.player_y = np.zeros(num_games)
+        self.player_vel_y = np.zeros(num_games, dtype=int)
+        self.player_index = np.zeros(num_games, dtype=int)
+        self.loop_iter = np.zeros(num_games, dtype=int)
+        self.index_iter = np.zeros(num_games, dtype=int)
+        self.frame_count = np.zeros(num_games, dtype=int)
+        self.score = np.zeros(num_games, dtype=int)
+        self.done = np.zeros(num_games, dtype=bool)
+        self.ground_crash = np.zeros(num_games, dtype=bool)
+
+        # pipe queue of every game, free slots are marked as invalid
+        self.pipe_x = np.zeros((num_games, MAX_PIPES))
+        self.pipe_gap_y = np.zeros((num_games, MAX_PIPES), dtype=int)
+        self.pipe_valid = np.zeros((num_games, MAX_PIPES), dtype=bool)
+
+        self.reset()
+
+    def randomGaps(self, size):
+        """returns the y of the gap of size new pipes, with the rules of getRandomPipe"""
+        return self.rng.integers(0, int(BASEY * 0.6 - PIPEGAPSIZE), size) + int(BASEY * 0.2)
+
+    def reset(self, games=None):
+        """
+        starts new games like showWelcomeAnimation and mainGame do
+
+        arguments:
+            games        (ndarray) - boolean mask or indices of the games to reset, None for all
+        returns:
+            observation  (dict)    - see observe()
+        """
+        if games is None:
+            games = np.arange(self.num_games)
+        games = np.arange(self.num_games)[games]
+        count = len(games)
+
+        self.player_y[games] = int((SCREENHEIGHT - PLAYER_HEIGHT) / 2)
+        self.player_vel_y[games] = PLAYER_VEL_Y
+        self.player_index[games] = 0
+        self.loop_iter[games] = 0
+        self.index_iter[games] = 0
+        self.frame_count[games] = 0
+        self.score[games] = 0
+        self.done[games] = False
+        self.ground_crash[games] = False
+
+        self.pipe_valid[games] = False
+        self.pipe_x[games, 0] = SCREENWIDTH + 200
+        self.pipe_x[games, 1] = SCREENWIDTH + 200 + (SCREENWIDTH / 2)
+        self.pipe_gap_y[games, 0] = self.randomGaps(count)
+        self.pipe_gap_y[games, 1] = self.randomGaps(count)
+        self.pipe_valid[games, :2] = True
+
+        return self.observe()
+
+    def observe(self):
+        """
+        returns the state of all games, the pipes of a game in no particular order
+
+        arguments:
+            none
+        returns:
+            observation  (dict) - player_y, player_vel_y (N,), pipe_x, upper_pipe_y,
+                                  lower_pipe_y, pipe_valid (N, MAX_PIPES), score and done (N,)
+        """
+        return {
+            'player_y': self.player_y.copy(),
+            'player_vel_y': self.player_vel_y.copy(),
+            'pipe_x': self.pipe_x.copy(),
+            'upper_pipe_y': self.pipe_gap_y - PIPE_HEIGHT,
+            'lower_pipe_y': self.pipe_gap_y + PIPEGAPSIZE,
+            'pipe_valid': self.pipe_valid.copy(),
+            'score': self.score.copy(),
+            'done': self.done.copy(),
+        }
+
+    def getGameState(self, game):
+        """returns the GameState of one game, e.g. to let an Agent decide on it"""
+        slots = sorted(np.flatnonzero(self.pipe_valid[game]), key=lambda slot: self.pipe_x[game, slot])
+        upperPipes = [{'x': self.pipe_x[game, slot].item(), 'y': int(self.pipe_gap_y[game, slot]) - PIPE_HEIGHT}
+                      for slot in slots]
+        lowerPipes = [{'x': self.pipe_x[game, slot].item(), 'y': int(self.pipe_gap_y[game, slot]) + PIPEGAPSIZE}
+                      for slot in slots]
+        return GameState(self.player_y[game].item(), int(self.player_vel_y[game]), upperPipes, lowerPipes)
+
+    def checkCrash(self, games):
+        """
+        vectorized checkCrash of the given games with their current player frame
+
+        arguments:
+            games        (ndarray) - indices of the games to check
+        returns:
+            crash        (ndarray) - True where the player crashed
+            ground       (ndarray) - True where the player crashed into the ground
+        """
+        player_y = self.player_y[games]
+        ground = player_y + PLAYER_HEIGHT >= BASEY - 1
+        crash = ground.copy()
+
+        playerY = np.trunc(player_y).astype(int)[:, None]
+        index = self.player_index[games][:, None]
+        dx = np.trunc(self.pipe_x[games]).astype(int) - PLAYER_X + PIPE_WIDTH - 1
+        inside_x = self.pipe_valid[games] & (dx >= 0) & (dx < PLAYER_WIDTH + PIPE_WIDTH - 1)
+        dx = np.clip(dx, 0, PLAYER_WIDTH + PIPE_WIDTH - 2)
+
+        tableHeight = PLAYER_HEIGHT + PIPE_HEIGHT - 1
+        for pipe, pipe_y in enumerate((self.pipe_gap_y[games] - PIPE_HEIGHT, self.pipe_gap_y[games] + PIPEGAPSIZE)):
+            dy = pipe_y - playerY + PIPE_HEIGHT - 1
+            inside = inside_x & (dy >= 0) & (dy < tableHeight)
+            collide = COLLISION_TABLE[index, pipe, dx, np.clip(dy, 0, tableHeight - 1)]
+            crash |= (inside & collide).any(axis=1)
+
+        return crash, ground
+
+    def step(self, actions):
+        """
+        applies one decision per game and advances all running games by self.frames frames
+
+        arguments:
+            actions      (ndarray) - whether each game's player flaps at the beginning of the step
+        returns:
+            observation  (dict)    - see observe()
+            reward       (ndarray) - pipes passed by each game during the step
+            done         (ndarray) - whether each game has crashed
+        """
+        actions = np.asarray(actions, dtype=bool)
+        reward = np.zeros(self.num_games, dtype=int)
+
+        for frame in range(self.frames):
+            games = np.flatnonzero(~self.done)
+            if not len(games):
+                break
+
+            # the agent only decides while the player is inside the screen
+            flapped = np.zeros(len(games), dtype=bool)
+            if frame == 0:
+                flapped = actions[games] & (self.player_y[games] > -2 * PLAYER_HEIGHT)
+                self.player_vel_y[games] = np.where(flapped, PLAYER_FLAP_ACC, self.player_vel_y[games])
+
+            # check for crash here
+            crash, ground = self.checkCrash(games)
+            self.done[games] = crash
+            self.ground_crash[games] = ground
+            flapped, games = flapped[~crash], games[~crash]
+
+            # check for score
+            playerMidPos = PLAYER_X + PLAYER_WIDTH / 2
+            pipeMidPos = self.pipe_x[games] + PIPE_WIDTH / 2
+            passed = (self.pipe_valid[games] & (pipeMidPos <= playerMidPos) & (playerMidPos < pipeMidPos + 4)).sum(axis=1)
+            self.score[games] += passed
+            reward[games] += passed
+
+            # playerIndex change
+            change = (self.loop_iter[games] + 1) % 3 == 0
+            index_iter = self.index_iter[games]
+            self.player_index[games] = np.where(change, PLAYER_INDEX_CYCLE[index_iter % len(PLAYER_INDEX_CYCLE)],
+                                                self.player_index[games])
+            self.index_iter[games] = index_iter + change
+            self.loop_iter[games] = (self.loop_iter[games] + 1) % 30
+
+            # player's movement
+            player_vel_y = self.player_vel_y[games]
+            accelerate = (player_vel_y < PLAYER_MAX_VEL_Y) & ~flapped
+            player_vel_y = np.where(accelerate, player_vel_y + PLAYER_ACC_Y, player_vel_y)
+            self.player_vel_y[games] = player_vel_y
+            player_y = self.player_y[games]
+            self.player_y[games] = player_y + np.minimum(player_vel_y, BASEY - player_y - PLAYER_HEIGHT)
+
+            self.movePipes(games)
+            self.frame_count[games] += 1
+
+        return self.observe(), reward, self.done.copy()
+
+    def movePipes(self, games):
+        """vectorized simulation.movePipes for the given games"""
+        self.pipe_x[games] += PIPE_VEL_X
+
+        # first pipe of each game, the leftmost valid one
+        pipe_x = np.where(self.pipe_valid[games], self.pipe_x[games], np.inf)
+        first = pipe_x.argmin(axis=1)
+        first_x = pipe_x[np.arange(len(games)), first]
+
+        # add new pipe when first pipe is about to touch left of screen
+        spawn = games[(0 < first_x) & (first_x < 5)]
+        if len(spawn):
+            slot = (~self.pipe_valid[spawn]).argmax(axis=1)
+            self.pipe_x[spawn, slot] = SCREENWIDTH + 10
+            self.pipe_gap_y[spawn, slot] = self.randomGaps(len(spawn))
+            self.pipe_valid[spawn, slot] = True
+
+        # remove first pipe if its out of the screen
+        remove = first_x < -PIPE_WIDTH
+        self.pipe_valid[games[remove], first[remove]] = False
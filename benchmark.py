@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# (C) 2018 Lukas Pilz & Conrad Sachweh
+
+"""NAME
+        %(prog)s - measures simulation throughput and decision latency
+
+SYNOPSIS
+        %(prog)s [--help]
+
+DESCRIPTION
+        Records the states of a seeded headless game and measures on
+        them the simulation components (GameState.advance, checkCrash,
+        pixelCollision, getScore) as well as findBestDecision of the
+        planners at several search depths. Reports ops/sec, mean, p50
+        and p99 latency as JSON, so results of different versions can
+        be compared. Also measures how many steps per second a game in
+        another process sustains when its observations reach the agent
+        through sharedenv or as pickled GameStates.
+
+AUTHOR
+        Lukas Pilz, <email>
+        Conrad Sachweh, conrad@csachweh.de
+"""
+
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+# keep the JSON report on stdout free of the pygame banner
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import numpy as np
+import pygame
+
+import agent
+import simulation
+from simulation import (PLAYER_X, PLAYER_WIDTH, PLAYER_HEIGHT, PIPE_WIDTH, PIPE_HEIGHT, HITMASKS,
+                        GameState, checkCrash, pixelCollision, playGame)
+from agent import PLANNERS, BatchAgent
+from server import Session
+from sharedenv import NO_FLAP, FLAP, STOP, SharedGame, SharedObservations
+
+def recordStates(num_states, seed):
+    """
+    Plays a seeded headless game and records the states the agent decided on
+
+    arguments:
+        num_states   (int)  - number of states to record
+        seed         (int)  - seed of the pipe generator
+    returns:
+        states       (list) - tuples of player y, velocity, upper and lower pipes
+    """
+    states = []
+
+    class Recorder(BatchAgent):
+        def findBestDecision(self, state):
+            states.append((state.player_y, state.player_vel_y,
+                           [dict(p) for p in state.upper_pipes],
+                           [dict(p) for p in state.lower_pipes]))
+            return super().findBestDecision(state)
+
+    random.seed(seed)
+    playGame(Recorder(), max_frames=num_states * 2)
+    return states[:num_states]
+
+def percentile(values, q):
+    """returns the q-th percentile of the sorted list values"""
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+def summarize(name, times, **extra):
+    """
+    turns the measured times of single operations into latency statistics
+
+    arguments:
+        name         (str)  - name of the measured operation
+        times        (list) - duration of every operation in seconds
+        extra        (dict) - further entries of the result
+    returns:
+        result       (dict) - ops/sec, mean, p50 and p99 latency in seconds
+    """
+    times = sorted(times)
+    result = {
+        'name': name,
+        'calls': len(times),
+        'ops_per_sec': len(times) / sum(times),
+        'mean': sum(times) / len(times),
+        'p50': percentile(times, 50),
+        'p99': percentile(times, 99),
+    }
+    result.update(extra)
+    return result
+
+def timeCalls(function, arguments, repeat):
+    """returns the duration of every call of function with each of the argument tuples, repeated"""
+    times = []
+    for _ in range(repeat):
+        for args in arguments:
+            start = time.perf_counter()
+            function(*args)
+            times.append(time.perf_counter() - start)
+    return times
+
+def benchmarkComponents(states, repeat):
+    """
+    Measures the building blocks of the simulation on the recorded states
+
+    arguments:
+        states       (list) - states as returned by recordStates
+        repeat       (int)  - how often every state is measured
+    returns:
+        results      (list) - statistics of each component
+    """
+    game_states = [GameState(*state) for state in states]
+    results = []
+
+    results.append(summarize('GameState.advance', timeCalls(
+        GameState.advance, [(state, flap) for state in game_states for flap in (False, True)], repeat)))
+
+    results.append(summarize('GameState.getScore', timeCalls(
+        GameState.getScore, [(state,) for state in game_states], repeat)))
+
+    results.append(summarize('checkCrash', timeCalls(
+        checkCrash, [({'x': PLAYER_X, 'y': player_y, 'index': index}, upperPipes, lowerPipes)
+                     for player_y, _, upperPipes, lowerPipes in states for index in range(3)], repeat)))
+
+    # the player against the nearest pipe ahead, whether they overlap or not
+    collisions = []
+    for player_y, _, upperPipes, lowerPipes in states:
+        uPipe, lPipe = min(zip(upperPipes, lowerPipes),
+                           key=lambda pipes: pipes[0]['x'] if PLAYER_X < pipes[0]['x'] + PIPE_WIDTH else np.inf)
+        playerRect = pygame.Rect(PLAYER_X, player_y, PLAYER_WIDTH, PLAYER_HEIGHT)
+        for pipe, p in enumerate((uPipe, lPipe)):
+            collisions.append((playerRect, pygame.Rect(p['x'], p['y'], PIPE_WIDTH, PIPE_HEIGHT),
+                               HITMASKS['player'][0], HITMASKS['pipe'][pipe]))
+    results.append(summarize('pixelCollision', timeCalls(pixelCollision, collisions, repeat)))
+
+    return results
+
+def benchmarkDecisions(planner, states, depth):
+    """
+    Times findBestDecision of the planner on every recorded state
+
+    arguments:
+        planner      (str)  - name of the planner in agent.PLANNERS
+        states       (list) - states as returned by recordStates
+        depth        (int)  - search depth of the planner
+    returns:
+        result       (dict) - latency statistics in seconds and peak memory per decision
+    """
+    agent.MAX_DEPTH = depth
+    decider = PLANNERS[planner]()
+    times = []
+    for player_y, player_vel_y, upperPipes, lowerPipes in states:
+        state = GameState(player_y, player_vel_y, upperPipes, lowerPipes)
+        start = time.perf_counter()
+        decider.findBestDecision(state)
+        times.append(time.perf_counter() - start)
+
+    # a second pass only measures memory, tracemalloc slows everything down
+    tracemalloc.start()
+    peak_memory = 0
+    for player_y, player_vel_y, upperPipes, lowerPipes in states:
+        state = GameState(player_y, player_vel_y, upperPipes, lowerPipes)
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        decider.findBestDecision(state)
+        peak_memory += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+
+    decider.close()
+    return summarize('findBestDecision', times, planner=planner, depth=depth,
+                     peak_bytes_per_decision=peak_memory / len(times))
+
+# height below which the agent of the transfer benchmark flaps, a trivial policy keeps the transfer dominant
+TRANSFER_FLAP_Y = 250
+
+def pickledGame(connection, seed):
+    """plays games like SharedGame.run, sending every observation as a pickled GameState through connection"""
+    game, games = Session(seed), 0
+    while True:
+        connection.send(GameState(game.player_y, game.player_vel_y, game.upper_pipes, game.lower_pipes))
+        action = connection.recv()
+        if action == STOP:
+            return
+        if game.crashed:
+            games += 1
+            game.reset(seed + games)
+        else:
+            game.step((action,))
+
+def benchmarkTransfer(steps, seed):
+    """
+    Measures the steps/sec of a game in another process whose agent receives the
+    observations through shared memory or as pickled GameStates through a pipe
+
+    arguments:
+        steps        (int)  - number of steps played by each variant
+        seed         (int)  - seed of the first game
+    returns:
+        results      (list) - statistics of each variant
+    """
+    results = []
+
+    game = SharedGame(seed)
+    process = multiprocessing.Process(target=game.run)
+    process.start()
+    observations = SharedObservations(game.name)
+    times = []
+    for _ in range(steps):
+        start = time.perf_counter()
+        record = observations.wait()
+        observations.act(FLAP if record['player_y'] > TRANSFER_FLAP_Y else NO_FLAP)
+        times.append(time.perf_counter() - start)
+    observations.wait()
+    observations.act(STOP)
+    process.join()
+    del record
+    observations.close()
+    game.close()
+    results.append(summarize('shared memory', times))
+
+    connection, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=pickledGame, args=(child, seed))
+    process.start()
+    times = []
+    for _ in range(steps):
+        start = time.perf_counter()
+        state = connection.recv()
+        connection.send(FLAP if state.player_y > TRANSFER_FLAP_Y else NO_FLAP)
+        times.append(time.perf_counter() - start)
+    connection.recv()
+    connection.send(STOP)
+    process.join()
+    results.append(summarize('pickled GameState', times))
+
+    return results
+
+def getVersion():
+    """returns the git commit of the benchmarked code, None outside of a checkout"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=simulation.assetPath('.')).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(args):
+    args = parse_args(args)
+    states = recordStates(args.states, args.seed)
+    default_depth = agent.MAX_DEPTH
+
+    report = {
+        'version': getVersion(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'seed': args.seed,
+        'states': len(states),
+        'components': benchmarkComponents(states, args.repeat) if not args.skip_components else [],
+        'decisions': [benchmarkDecisions(planner, states, depth)
+                      for planner in args.planner for depth in args.depth],
+        'transfer': benchmarkTransfer(args.transfer_steps, args.seed) if args.transfer_steps else [],
+    }
+    agent.MAX_DEPTH = default_depth
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+def parse_args(args):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="MyOptions")
+    parser.add_argument('--planner', choices=sorted(PLANNERS), action='append',
+                        help='planner to benchmark, can be given multiple times (default: all but anytime)')
+    parser.add_argument('--depth', type=int, action='append',
+                        help='search depth of the decisions, at most MAX_VISIBLE_DEPTH, can be given multiple times '
+                             '(default: 5, 10, 15 and MAX_DEPTH)')
+    parser.add_argument('--states', type=int, default=100,
+                        help='number of recorded states to decide on')
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='how often the components are measured on every state')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the recorded game')
+    parser.add_argument('--skip-components', action='store_true',
+                        help='only benchmark the decisions')
+    parser.add_argument('--transfer-steps', type=int, default=20000,
+                        help='steps of the observation transfer benchmark, 0 to skip it')
+    parser.add_argument('-o', '--output',
+                        help='write the JSON report to this file instead of stdout')
+
+    args = parser.parse_args(args[1:])
+    if not args.planner:
+        # the anytime planner uses its time budget no matter the depth
+        args.planner = sorted(set(PLANNERS) - {'anytime'})
+    if not args.depth:
+        args.depth = sorted({5, 10, 15, int(agent.MAX_DEPTH)})
+    # the searches are only prepared for the ticks until the screen's edge
+    for depth in args.depth:
+        if not 1 <= depth <= int(agent.MAX_VISIBLE_DEPTH):
+            parser.error("--depth must be between 1 and {}".format(int(agent.MAX_VISIBLE_DEPTH)))
+    return args
+
+if __name__ == '__main__':
+    main(sys.argv[:])
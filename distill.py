@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# (C) 2018 Lukas Pilz & Conrad Sachweh
+
+"""NAME
+        %(prog)s - distills the tree search into a fast policy
+
+SYNOPSIS
+        %(prog)s [--help] DATASET
+
+DESCRIPTION
+        Trains a policy.Policy on the decisions of a trajectory dataset,
+        as written by tournament.py --trajectories, and saves it for
+        flappy.py --policy. Reports as JSON how often the policy agrees
+        with the recorded decisions, on the games it was trained on and
+        on held out ones, and plays headless games with the search, the
+        policy alone and the policy falling back to the search when it
+        is unsure, comparing their scores and decisions per second.
+
+        A policy trained on the games of the search alone rarely sees
+        the states its own mistakes lead to. Each of --rounds further
+        rounds plays games with the policy, labels every state it
+        visits with the decision of the search and trains again on all
+        decisions so far (dataset aggregation). --games 0 skips the rounds
+        along with the evaluation.
+
+AUTHOR
+        Lukas Pilz, <email>
+        Conrad Sachweh, conrad@csachweh.de
+"""
+
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+# keep the JSON report on stdout free of the pygame banner
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import numpy as np
+
+from simulation import AGENT_FREQ, playGame
+from agent import PLANNERS
+from policy import HIDDEN, Policy, PolicyAgent, datasetFeatures
+from trajectories import Trajectory, TrajectoryReader
+from tournament import gameSeed
+
+def splitGames(games, validation, seed):
+    """
+    splits the decisions by game, so no held out decision comes from a game trained on
+
+    arguments:
+        games        (ndarray) - game of every decision
+        validation   (float)   - share of the games to hold out
+        seed         (int)     - seed of the split
+    returns:
+        train        (ndarray) - True for the decisions to train on
+    """
+    unique = np.unique(games)
+    held_out = np.random.default_rng(seed).choice(unique, int(round(validation * len(unique))), replace=False)
+    return ~np.isin(games, held_out)
+
+class LabelingAgent():
+    """plays with agent while recording the decision of search on every state into trajectory"""
+    def __init__(self, agent, search, trajectory):
+        self.agent = agent
+        self.search = search
+        self.trajectory = trajectory
+        self.decisions = 0
+
+    def findBestDecision(self, state):
+        """records the decision of the search on state, returns the one of the agent"""
+        self.trajectory.addDecision(AGENT_FREQ * self.decisions, state, *self.search.findBestDecision(state))
+        self.decisions += 1
+        return self.agent.findBestDecision(state)
+
+def aggregate(policy, args, number):
+    """
+    plays --games games with the policy and labels the visited states with the search
+
+    arguments:
+        policy       (Policy)    - the policy playing
+        args         (Namespace) - parsed command line
+        number       (int)       - number of the round, games of different rounds get different seeds
+    returns:
+        records      (ndarray)   - the labeled states as trajectories.RECORD
+        scores       (list)      - score of every game
+    """
+    search = PLANNERS[args.planner]()
+    trajectories, scores = [], []
+    for game in range(args.games):
+        # seeds of their own, the evaluation games are never trained on
+        seed = gameSeed(args.seed + 1 + number, game)
+        trajectory = Trajectory(seed)
+        random.seed(seed)
+        scores.append(playGame(LabelingAgent(PolicyAgent(policy), search, trajectory),
+                               max_frames=args.max_frames)['score'])
+        trajectories.append(trajectory.records())
+    search.close()
+    return np.concatenate(trajectories), scores
+
+def agreement(policy, inputs, labels):
+    """returns the share of decisions on which the policy decides like the search, None without decisions"""
+    if not len(labels):
+        return None
+    return float(np.mean((policy.probability(inputs) > 0.5) == labels))
+
+def evaluate(agent, seeds, max_frames):
+    """
+    plays a headless game per seed
+
+    arguments:
+        agent        (Agent) - agent deciding whether to flap
+        seeds        (list)  - seeds of the games
+        max_frames   (int)   - stop a game after this many frames
+    returns:
+        result       (dict)  - scores, their mean and decisions per second
+    """
+    scores, decisions, duration = [], 0, 0.
+    for seed in seeds:
+        random.seed(seed)
+        start = time.perf_counter()
+        crashInfo = playGame(agent, max_frames=max_frames)
+        duration += time.perf_counter() - start
+        scores.append(crashInfo['score'])
+        decisions += crashInfo['decisions']
+    result = {
+        'scores': scores,
+        'mean': statistics.mean(scores),
+        'decisions_per_sec': decisions / duration,
+    }
+    if isinstance(agent, PolicyAgent):
+        result['fallback_share'] = agent.fallback_decisions / max(agent.fallback_decisions + agent.policy_decisions, 1)
+    agent.close()
+    return result
+
+def main(args):
+    args = parse_args(args)
+    reader = TrajectoryReader(args.dataset)
+    inputs, labels, games = datasetFeatures(reader)
+    train = splitGames(games, args.validation, args.seed)
+
+    policy = Policy.create(inputs[train], args.hidden, args.seed)
+    start = time.perf_counter()
+    losses = policy.train(inputs[train], labels[train], args.epochs, rng=args.seed)
+    training_seconds = time.perf_counter() - start
+
+    rounds = []
+    # the rounds play --games games each, without games there is nothing to aggregate
+    for number in range(args.rounds if args.games else 0):
+        records, scores = aggregate(policy, args, number)
+        new_inputs, new_labels, _ = datasetFeatures(records)
+        inputs, labels = np.concatenate([inputs, new_inputs]), np.concatenate([labels, new_labels])
+        train = np.concatenate([train, np.ones(len(new_labels), dtype=bool)])
+
+        start = time.perf_counter()
+        losses = policy.train(inputs[train], labels[train], args.epochs, rng=args.seed + 1 + number)
+        training_seconds += time.perf_counter() - start
+        rounds.append({'decisions': len(new_labels), 'mean': statistics.mean(scores)})
+    policy.save(args.output)
+
+    report = {
+        'decisions': len(labels),
+        'flap_share': float(labels.mean()),
+        'training_seconds': training_seconds,
+        'loss': losses[-1],
+        'rounds': rounds,
+        'agreement_train': agreement(policy, inputs[train], labels[train]),
+        'agreement_validation': agreement(policy, inputs[~train], labels[~train]),
+    }
+
+    if args.games:
+        seeds = [gameSeed(args.seed, game) for game in range(args.games)]
+        report['search'] = evaluate(PLANNERS[args.planner](), seeds, args.max_frames)
+        report['policy'] = evaluate(PolicyAgent(policy), seeds, args.max_frames)
+        report['policy_fallback'] = evaluate(PolicyAgent(policy, PLANNERS[args.planner](), args.threshold),
+                                             seeds, args.max_frames)
+
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+def parse_args(args):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="MyOptions")
+    parser.add_argument('dataset',
+                        help='trajectory dataset with the decisions of the search')
+    parser.add_argument('-o', '--output', default='policy.npz',
+                        help='file the trained policy is written to')
+    parser.add_argument('--hidden', type=int, default=HIDDEN,
+                        help='number of hidden units of the policy')
+    parser.add_argument('--epochs', type=int, default=100,
+                        help='passes over the training decisions, per round')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='rounds of playing --games games with the policy and learning the decisions of the search '
+                             'on its states')
+    parser.add_argument('--validation', type=float, default=0.2,
+                        help='share of the games held out from training')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the training and of the evaluated games')
+    parser.add_argument('--planner', choices=sorted(PLANNERS), default='tree',
+                        help='search the policy is compared with and falls back to')
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help='confidence below which the policy falls back to the search in the evaluation')
+    parser.add_argument('--games', type=int, default=10,
+                        help='number of games of every round and of each agent in the evaluation, '
+                             '0 to skip the rounds and the evaluation')
+    parser.add_argument('--max-frames', type=int, default=3000,
+                        help='end an evaluated game after this many frames')
+
+    args = parser.parse_args(args[1:])
+    if args.games < 0:
+        parser.error("--games must not be negative")
+    return args
+
+if __name__ == '__main__':
+    main(sys.argv[:])
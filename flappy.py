@@ -28,117 +28,68 @@ AUTHOR
 from itertools import cycle
 import random
 import sys
-import numpy as np
-from copy import deepcopy
-from operator import itemgetter
+import time
 
+import numpy as np
 import pygame
 from pygame.locals import QUIT, KEYDOWN, K_ESCAPE, K_SPACE, K_UP, K_p, K_m
 
-import concurrent.futures
-executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
-
-FPS = 30
-SCREENWIDTH  = 288
-SCREENHEIGHT = 512
-# amount by which base can maximum shift to left
-PIPEGAPSIZE  = 100 # gap between upper and lower part of pipe
-BASEY        = SCREENHEIGHT * 0.79
-# image, sound and hitmask  dicts
-IMAGES, SOUNDS, HITMASKS = {}, {}, {}
-FRAME_SKIP = 2
-AGENT_FREQ = FRAME_SKIP
+from simulation import (FPS, SCREENWIDTH, SCREENHEIGHT, BASEY, FRAME_SKIP, AGENT_FREQ,
+                        PLAYER_X, PIPE_VEL_X, PLAYER_VEL_Y, PLAYER_MAX_VEL_Y, PLAYER_MIN_VEL_Y,
+                        PLAYER_ACC_Y, PLAYER_FLAP_ACC, PLAYERS_LIST, BACKGROUNDS_LIST, PIPES_LIST,
+                        GameState, checkCrash, getInitialPipes, movePipes, countPassedPipes, playGame)
+from agent import PLANNERS, ParallelAgent, AsyncDecisions
+from policy import Policy, PolicyAgent
+from instrumentation import Profiler
+from replay import Recording, replayGame
+from renderer import Renderer
+from assets import Sprites
+
+
+# image and sound dicts
+IMAGES, SOUNDS = {}, {}
 ENABLE_ROT = False
-NUM_PATHS_VISIBLE = 5
 SHOW_OTHER_PATHS = True
+# font of the profiling overlay, loaded on first use
+FONT = None
 
-PLAYER_X = int(SCREENWIDTH * 0.2)
-PIPE_VEL_X = -4
-
-# player velocity, max velocity, downward accleration, accleration on flap
+# player rotation
 PLAYER_ROT_DEFAULT = 45
-PLAYER_VEL_Y_DEFAULT = -9
-PLAYER_VEL_Y = PLAYER_VEL_Y_DEFAULT  # player's velocity along Y, default same as playerFlapped
 PLAYER_ROT = PLAYER_ROT_DEFAULT   # player's rotation
-PLAYER_MAX_VEL_Y =  10   # max vel along Y, max descend speed
-PLAYER_MIN_VEL_Y =  -8   # min vel along Y, max ascend speed TODO: implement?
-PLAYER_ACC_Y    =   1   # players downward accleration
 PLAYER_VEL_ROT  =   3   # angular speed
 PLAYER_ROT_THR  =  20   # rotation threshold
-PLAYER_FLAP_ACC =  -9   # players speed on flapping
-SCORE_DISTR_VARIANCE = PIPEGAPSIZE/4 - 5
-MAX_VISIBLE_DEPTH = (SCREENWIDTH - PLAYER_X) / abs(PIPE_VEL_X) / FRAME_SKIP
-
-MAX_DESIRED_DEPTH = 19
-MAX_DEPTH = min(MAX_DESIRED_DEPTH, MAX_VISIBLE_DEPTH)
-MAX_PATHS = 15
-
-# list of all possible players (tuple of 3 positions of flap)
-PLAYERS_LIST = (
-    # red bird
-    (
-        'assets/sprites/redbird-upflap.png',
-        'assets/sprites/redbird-midflap.png',
-        'assets/sprites/redbird-downflap.png',
-    ),
-    # blue bird
-    (
-        # amount by which base can maximum shift to left
-        'assets/sprites/bluebird-upflap.png',
-        'assets/sprites/bluebird-midflap.png',
-        'assets/sprites/bluebird-downflap.png',
-    ),
-    # yellow bird
-    (
-        'assets/sprites/yellowbird-upflap.png',
-        'assets/sprites/yellowbird-midflap.png',
-        'assets/sprites/yellowbird-downflap.png',
-    ),
-)
-
-# list of backgrounds
-BACKGROUNDS_LIST = (
-    'assets/sprites/background-day.png',
-    'assets/sprites/background-night.png',
-)
-
-# list of pipes
-PIPES_LIST = (
-    'assets/sprites/pipe-green.png',
-    'assets/sprites/pipe-red.png',
-)
+PLAYER_CRASH_VEL_ROT = 7   # angular speed while falling down after a crash
+
+# most frames simulated between two rendered ones, further behind the game slows down
+MAX_STEPS_PER_RENDER = 5
 
 def main(args):
     args = parse_args(args)
     if args.verbose:
         print("[INFO] arguments passed:", args)
 
-    global SCREEN, FPSCLOCK
+    if args.headless:
+        return mainHeadless(args)
+
+    global SCREEN, FPSCLOCK, RENDERER, SPRITES
     pygame.init()
     FPSCLOCK = pygame.time.Clock()
     SCREEN = pygame.display.set_mode((SCREENWIDTH, SCREENHEIGHT))
+    RENDERER = Renderer(SCREEN)
     pygame.display.set_caption('Flappy Bird')
 
+    # every sprite and rotation of the player is loaded once, the games only pick from them
+    SPRITES = Sprites(*playerAngles())
+
     # numbers sprites for score display
-    IMAGES['numbers'] = (
-        pygame.image.load('assets/sprites/0.png').convert_alpha(),
-        pygame.image.load('assets/sprites/1.png').convert_alpha(),
-        pygame.image.load('assets/sprites/2.png').convert_alpha(),
-        pygame.image.load('assets/sprites/3.png').convert_alpha(),
-        pygame.image.load('assets/sprites/4.png').convert_alpha(),
-        pygame.image.load('assets/sprites/5.png').convert_alpha(),
-        pygame.image.load('assets/sprites/6.png').convert_alpha(),
-        pygame.image.load('assets/sprites/7.png').convert_alpha(),
-        pygame.image.load('assets/sprites/8.png').convert_alpha(),
-        pygame.image.load('assets/sprites/9.png').convert_alpha()
-    )
+    IMAGES['numbers'] = SPRITES.numbers()
 
     # game over sprite
-    IMAGES['gameover'] = pygame.image.load('assets/sprites/gameover.png').convert_alpha()
+    IMAGES['gameover'] = SPRITES['gameover']
     # message sprite for welcome screen
-    IMAGES['message'] = pygame.image.load('assets/sprites/message.png').convert_alpha()
+    IMAGES['message'] = SPRITES['message']
     # base (ground) sprite
-    IMAGES['base'] = pygame.image.load('assets/sprites/base.png').convert_alpha()
+    IMAGES['base'] = SPRITES['base']
 
     # sounds
     if 'win' in sys.platform:
@@ -152,49 +103,147 @@ def main(args):
     SOUNDS['swoosh'] = pygame.mixer.Sound('assets/audio/swoosh' + soundExt)
     SOUNDS['wing']   = pygame.mixer.Sound('assets/audio/wing' + soundExt)
 
-    # iterates over multiple games
+    # the agent keeps its transposition table and worker processes over all games
+    replay = Recording.load(args.replay) if args.replay else None
+    agent = createAgent(args) if replay is None else None
+    decisions = AsyncDecisions(agent) if agent is not None and not args.single_core else None
+    profiler = createProfiler(args)
+    seeds = gameSeeds(args, replay)
+
+    # iterates over multiple games, until the window is closed
+    try:
+        while True:
+            seed = startGame(args, seeds)
+            recording = Recording(seed) if args.record else None
+
+            # select random background sprites
+            randBg = random.randint(0, len(BACKGROUNDS_LIST) - 1)
+            IMAGES['background'] = SPRITES.backgrounds[randBg]
+            RENDERER.setBackground(IMAGES['background'])
+
+            # select random player sprites
+            randPlayer = random.randint(0, len(PLAYERS_LIST) - 1)
+            IMAGES['player'] = SPRITES.player(randPlayer)
+
+            # select random pipe sprites
+            pipeindex = random.randint(0, len(PIPES_LIST) - 1)
+            IMAGES['pipe'] = SPRITES.pipe(pipeindex)
+
+            movementInfo = showWelcomeAnimation(args.restart or replay is not None)
+            crashInfo = mainGame(args, movementInfo, agent, profiler, recording, replay, decisions)
+            if args.stats:
+                profiler.dump(args.stats)
+            if recording:
+                saveRecording(args, recording, crashInfo)
+            if replay:
+                print("replayed score: {} (recorded: {})".format(crashInfo['score'], replay.score))
+            if args.restart:
+                print("reached score: {}".format(crashInfo['score']))
+            else:
+                showGameOverScreen(crashInfo)
+                #wait()
+    finally:
+        # sys.exit() on quit ends up here as well
+        if decisions:
+            decisions.close()
+        if agent:
+            agent.close()
+
+def playerAngles():
+    """
+    Lists the rotations of the player the game can show, so they are rotated once
+    instead of every frame
+
+    arguments:
+        none
+    returns:
+        player_angles (set) - angles of all player frames shown by mainGame
+        crash_angles  (set) - angles of the frame shown by showGameOverScreen
+    """
+    rotations = [PLAYER_ROT]
+    while ENABLE_ROT and rotations[-1] > -90:
+        rotations.append(rotations[-1] - PLAYER_VEL_ROT)
+    player_angles = {min(rot, PLAYER_ROT_THR) if ENABLE_ROT else 0 for rot in rotations}
+
+    # the crash starts at the rotation of the game's last frame
+    crash_angles = set()
+    for rot in rotations:
+        crash_angles.add(rot)
+        while rot > -90:
+            rot -= PLAYER_CRASH_VEL_ROT
+            crash_angles.add(rot)
+    return player_angles, crash_angles
+
+def createSearch(args):
+    """returns the searching agent selected on the command line"""
+    if args.workers > 1:
+        return ParallelAgent(args.workers)
+    return PLANNERS[args.planner]()
+
+def createAgent(args):
+    """returns the agent selected on the command line, the distilled policy with --policy"""
+    if args.policy:
+        fallback = createSearch(args) if args.policy_threshold > 0 else None
+        return PolicyAgent(Policy.load(args.policy), fallback, args.policy_threshold)
+    return createSearch(args)
+
+def createProfiler(args):
+    """returns a Profiler if the overlay or the stats file is wanted, None otherwise"""
+    if args.overlay or args.stats:
+        return Profiler()
+    return None
+
+def gameSeeds(args, replay=None):
+    """yields the seed of every game, counting up from --seed or a random seed; the recorded one when replaying"""
+    if replay:
+        while True:
+            yield replay.seed
+
+    # a recording stores the seed as unsigned 32 bit
+    seed = args.seed % 2 ** 32 if args.seed is not None else random.randrange(2 ** 32)
     while True:
-        # select random background sprites
-        randBg = random.randint(0, len(BACKGROUNDS_LIST) - 1)
-        IMAGES['background'] = pygame.image.load(BACKGROUNDS_LIST[randBg]).convert()
-
-        # select random player sprites
-        randPlayer = random.randint(0, len(PLAYERS_LIST) - 1)
-        IMAGES['player'] = (
-            pygame.image.load(PLAYERS_LIST[randPlayer][0]).convert_alpha(),
-            pygame.image.load(PLAYERS_LIST[randPlayer][1]).convert_alpha(),
-            pygame.image.load(PLAYERS_LIST[randPlayer][2]).convert_alpha(),
-        )
-
-        # select random pipe sprites
-        pipeindex = random.randint(0, len(PIPES_LIST) - 1)
-        IMAGES['pipe'] = (
-            pygame.transform.rotate(
-                pygame.image.load(PIPES_LIST[pipeindex]).convert_alpha(), 180),
-            pygame.image.load(PIPES_LIST[pipeindex]).convert_alpha(),
-        )
-
-        # hismask for pipes
-        HITMASKS['pipe'] = (
-            getHitmask(IMAGES['pipe'][0]),
-            getHitmask(IMAGES['pipe'][1]),
-        )
-
-        # hitmask for player
-        HITMASKS['player'] = (
-            getHitmask(IMAGES['player'][0]),
-            getHitmask(IMAGES['player'][1]),
-            getHitmask(IMAGES['player'][2]),
-        )
-
-        movementInfo = showWelcomeAnimation(args.restart)
-        crashInfo = mainGame(args, movementInfo)
-        if args.restart:
-            print("reached score: {}".format(crashInfo['score']))
-            main(args)
-        else:
-            showGameOverScreen(crashInfo)
-            #wait()
+        yield seed
+        seed = (seed + 1) % 2 ** 32
+
+def startGame(args, seeds):
+    """seeds the random module for the next game, which makes its sprites and pipes reproducible"""
+    seed = next(seeds)
+    random.seed(seed)
+    if args.verbose:
+        print("[INFO] seed of the game:", seed)
+    return seed
+
+def saveRecording(args, recording, crashInfo):
+    """writes the recording of a finished game to the file given by --record"""
+    recording.finish(crashInfo)
+    recording.save(args.record.format(seed=recording.seed))
+
+def mainHeadless(args):
+    """plays games without a display as fast as the CPU allows"""
+    if args.replay:
+        replay = Recording.load(args.replay)
+        crashInfo = replayGame(replay, args.max_frames)
+        print("replayed score: {} after {} frames (recorded: {} after {} frames)".format(
+            crashInfo['score'], crashInfo['frames'], replay.score, replay.frames))
+        if (crashInfo['score'], crashInfo['frames']) != (replay.score, replay.frames) and args.max_frames is None:
+            sys.exit("replay differs from the recording")
+        return crashInfo
+
+    agent = createAgent(args)
+    profiler = createProfiler(args)
+    seeds = gameSeeds(args)
+    while True:
+        seed = startGame(args, seeds)
+        recording = Recording(seed) if args.record else None
+        crashInfo = playGame(agent, args.verbose, args.max_frames, profiler, recording)
+        if recording:
+            saveRecording(args, recording, crashInfo)
+        print("reached score: {}".format(crashInfo['score']))
+        if args.stats:
+            profiler.dump(args.stats)
+        if not args.restart:
+            agent.close()
+            return crashInfo
 
 def wait():
     """Waits for keystroke, used for debugging"""
@@ -255,16 +304,16 @@ def showWelcomeAnimation(autostart = False):
         playerShm(playerShmVals)
 
         # draw sprites
-        SCREEN.blit(IMAGES['background'], (0,0))
-        SCREEN.blit(IMAGES['player'][playerIndex],
-                    (PLAYER_X, playery + playerShmVals['val']))
-        SCREEN.blit(IMAGES['message'], (messagex, messagey))
-        SCREEN.blit(IMAGES['base'], (basex, BASEY))
+        RENDERER.clear()
+        RENDERER.blit(IMAGES['player'][playerIndex],
+                      (PLAYER_X, playery + playerShmVals['val']))
+        RENDERER.blit(IMAGES['message'], (messagex, messagey))
+        RENDERER.blit(IMAGES['base'], (basex, BASEY))
 
-        pygame.display.update()
+        RENDERER.update()
         FPSCLOCK.tick(FPS)
 
-def mainGame(args, movementInfo):
+def mainGame(args, movementInfo, agent, profiler=None, recording=None, replay=None, decisions=None):
     global PLAYER_X
     global PIPE_VEL_X
     global PLAYER_VEL_Y
@@ -283,30 +332,28 @@ def mainGame(args, movementInfo):
     basex = movementInfo['basex']
     baseShift = IMAGES['base'].get_width() - IMAGES['background'].get_width()
 
-    # get 2 new pipes to add to upperPipes lowerPipes list
-    newPipe1 = getRandomPipe()
-    newPipe2 = getRandomPipe()
-
-    # list of upper pipes
-    upperPipes = [
-        {'x': SCREENWIDTH + 200, 'y': newPipe1[0]['y']},
-        {'x': SCREENWIDTH + 200 + (SCREENWIDTH / 2), 'y': newPipe2[0]['y']},
-    ]
-
-    # list of lowerpipe
-    lowerPipes = [
-        {'x': SCREENWIDTH + 200, 'y': newPipe1[1]['y']},
-        {'x': SCREENWIDTH + 200 + (SCREENWIDTH / 2), 'y': newPipe2[1]['y']},
-    ]
+    # a replay takes the pipes and flaps from the recording instead of the random module and the agent
+    gaps = None
+    if replay:
+        playery = replay.player_y
+        gaps = replay.replayGaps()
+    if recording:
+        recording.player_y = playery
+        gaps = recording.recordGaps(gaps)
+    upperPipes, lowerPipes = getInitialPipes(gaps)
 
     playerFlapped = False # True when player flaps
     frame_count = 0
     path_frame_start = 0
+    optimal_path = []
+    path_points = []
     player_vel_y = PLAYER_VEL_Y
     player_rot = PLAYER_ROT
 
-    global JOBS
-    JOBS = None
+    # the simulation advances in fixed steps of one frame, rendering catches up by dropping frames
+    next_step = time.perf_counter()
+    if decisions:
+        decisions.reset()
 
     while True:
         for event in pygame.event.get():
@@ -318,117 +365,132 @@ def mainGame(args, movementInfo):
                         i.set_volume(0)
             if event.type == KEYDOWN and (event.key == K_p):
                 wait()
+                next_step = time.perf_counter()
             if event.type == QUIT or (event.type == KEYDOWN and event.key == K_ESCAPE):
+                if args.stats:
+                    profiler.dump(args.stats)
                 pygame.quit()
                 sys.exit()
-            if event.type == KEYDOWN and (event.key == K_SPACE or event.key == K_UP):
+            if event.type == KEYDOWN and (event.key == K_SPACE or event.key == K_UP) and not replay:
                 if playery > -2 * IMAGES['player'][0].get_height():
                     player_vel_y = PLAYER_FLAP_ACC
                     playerFlapped = True
                     SOUNDS['wing'].play()
 
-        if playery > -2 * IMAGES['player'][0].get_height():
-            if not frame_count % AGENT_FREQ:
-                path_frame_start = frame_count
-
-                agent = Agent()
+        steps = 0
+        while time.perf_counter() >= next_step and steps < MAX_STEPS_PER_RENDER:
+            if profiler:
+                profiler.startFrame()
 
-                if args.single_core:
-                    flap, optimal_path = agent.findBestDecision(GameState(playery, player_vel_y, upperPipes, lowerPipes))
-                else:
-                    State = GameState(playery, player_vel_y, upperPipes, lowerPipes)
-
-                    try:
-                        for future in concurrent.futures.as_completed(JOBS):
-                            task = JOBS[future]
-                            flap, optimal_path = future.result()
-                    except TypeError: # we got our first run here
-                        flap, optimal_path = False, []
-
-                    FutureState = State.nextStep(flap)
-                    tasks = [(agent, FutureState)]
-                    JOBS = {executor.submit(x[0].findBestDecision, x[1]): x for x in tasks}
-
-                color = GREEN = "\033[0;32m" # debug output color
-                if flap:
+            if replay:
+                if replay.flapped(frame_count):
                     player_vel_y = PLAYER_FLAP_ACC
                     playerFlapped = True
                     SOUNDS['wing'].play()
-                    flap = False
-                    color = RED = "\033[1;31m"
-                if args.verbose > 2:
-                    print("{}DEBUG_agent; flap: {} path: {}".format(color, flap, optimal_path))
-
-        # check for crash here
-        crashTest = checkCrash({'x': PLAYER_X, 'y': playery, 'index': playerIndex},
-                               upperPipes, lowerPipes)
-        if crashTest[0]:
-            return {
-                'y': playery,
-                'groundCrash': crashTest[1],
-                'basex': basex,
-                'upperPipes': upperPipes,
-                'lowerPipes': lowerPipes,
-                'score': score,
-                'player_vel_y': player_vel_y,
-                'player_rot': player_rot
-            }
-
-        # check for score
-        playerMidPos = PLAYER_X + IMAGES['player'][0].get_width() / 2
-        for pipe in upperPipes:
-            pipeMidPos = pipe['x'] + IMAGES['pipe'][0].get_width() / 2
-            if pipeMidPos <= playerMidPos < pipeMidPos + 4:
-                score += 1
+            elif playery > -2 * IMAGES['player'][0].get_height():
+                if not frame_count % AGENT_FREQ:
+                    path_frame_start = frame_count
+                    State = GameState(playery, player_vel_y, upperPipes, lowerPipes)
+
+                    if args.single_core:
+                        flap, optimal_path = agent.findBestDecision(State)
+                        if profiler:
+                            profiler.endDecision()
+                    else:
+                        # the search of this decision ran during the last tick, the game doesn't wait for it
+                        flap, optimal_path, late = decisions.decide(State, frame_count)
+                        if profiler:
+                            if late:
+                                profiler.counters['late_decisions'] += 1
+                            profiler.endDecision()
+                    path_points = pathPoints(optimal_path)
+
+                    color = GREEN = "\033[0;32m" # debug output color
+                    if flap:
+                        player_vel_y = PLAYER_FLAP_ACC
+                        playerFlapped = True
+                        SOUNDS['wing'].play()
+                        flap = False
+                        color = RED = "\033[1;31m"
+                    if args.verbose > 2:
+                        print("{}DEBUG_agent; flap: {} path: {}".format(color, flap, optimal_path))
+                    if args.verbose > 1:
+                        print("DEBUG_agent; {}".format(agent.statistics()))
+            if profiler:
+                profiler.mark('agent')
+            if recording:
+                recording.addFrame(playerFlapped)
+
+            # check for crash here
+            crashTest = checkCrash({'x': PLAYER_X, 'y': playery, 'index': playerIndex},
+                                   upperPipes, lowerPipes)
+            if crashTest[0]:
+                return {
+                    'y': playery,
+                    'groundCrash': crashTest[1],
+                    'basex': basex,
+                    'upperPipes': upperPipes,
+                    'lowerPipes': lowerPipes,
+                    'score': score,
+                    'player_vel_y': player_vel_y,
+                    'player_rot': player_rot,
+                    'frames': frame_count,
+                }
+
+            # check for score
+            passed = countPassedPipes(upperPipes)
+            if passed:
+                score += passed
                 SOUNDS['point'].play()
 
-        # playerIndex basex change
-        if (loopIter + 1) % 3 == 0:
-            playerIndex = next(playerIndexGen)
-        loopIter = (loopIter + 1) % 30
-        basex = -((-basex + 100) % baseShift)
+            # playerIndex basex change
+            if (loopIter + 1) % 3 == 0:
+                playerIndex = next(playerIndexGen)
+            loopIter = (loopIter + 1) % 30
+            basex = -((-basex + 100) % baseShift)
 
-        # rotate the player
-        if player_rot > -90 and ENABLE_ROT:
-            player_rot -= PLAYER_VEL_ROT
+            # rotate the player
+            if player_rot > -90 and ENABLE_ROT:
+                player_rot -= PLAYER_VEL_ROT
 
-        # player's movement
-        if player_vel_y < PLAYER_MAX_VEL_Y and not playerFlapped:
-            player_vel_y += PLAYER_ACC_Y
-        if playerFlapped:
-            playerFlapped = False
+            # player's movement
+            if player_vel_y < PLAYER_MAX_VEL_Y and not playerFlapped:
+                player_vel_y += PLAYER_ACC_Y
+            if playerFlapped:
+                playerFlapped = False
 
-            # more rotation to cover the threshold (calculated in visible rotation)
-            if ENABLE_ROT:
-                player_rot = 45
+                # more rotation to cover the threshold (calculated in visible rotation)
+                if ENABLE_ROT:
+                    player_rot = 45
 
-        playerHeight = IMAGES['player'][playerIndex].get_height()
-        playery += min(player_vel_y, BASEY - playery - playerHeight)
+            playerHeight = IMAGES['player'][playerIndex].get_height()
+            playery += min(player_vel_y, BASEY - playery - playerHeight)
 
-        # move pipes to left
-        for uPipe, lPipe in zip(upperPipes, lowerPipes):
-            uPipe['x'] += PIPE_VEL_X
-            lPipe['x'] += PIPE_VEL_X
+            movePipes(upperPipes, lowerPipes, gaps)
+            if profiler:
+                profiler.mark('simulate')
 
-        # add new pipe when first pipe is about to touch left of screen
-        if 0 < upperPipes[0]['x'] < 5:
-            newPipe = getRandomPipe()
-            upperPipes.append(newPipe[0])
-            lowerPipes.append(newPipe[1])
+            frame_count += 1
+            next_step += 1 / FPS
+            steps += 1
 
-        # remove first pipe if its out of the screen
-        if upperPipes[0]['x'] < -IMAGES['pipe'][0].get_width():
-            upperPipes.pop(0)
-            lowerPipes.pop(0)
+        if not steps:
+            time.sleep(max(0, next_step - time.perf_counter()))
+            continue
+        if profiler and steps > 1:
+            profiler.counters['dropped_frames'] += steps - 1
+        if steps == MAX_STEPS_PER_RENDER:
+            # too far behind to catch up, the game slows down instead of never being drawn
+            next_step = max(next_step, time.perf_counter())
 
-        # draw sprites
-        SCREEN.blit(IMAGES['background'], (0,0))
+        # draw sprites, only the parts of the screen drawn in this or the last frame are repainted
+        RENDERER.clear()
 
         for uPipe, lPipe in zip(upperPipes, lowerPipes):
-            SCREEN.blit(IMAGES['pipe'][0], (uPipe['x'], uPipe['y']))
-            SCREEN.blit(IMAGES['pipe'][1], (lPipe['x'], lPipe['y']))
+            RENDERER.blit(IMAGES['pipe'][0], (uPipe['x'], uPipe['y']))
+            RENDERER.blit(IMAGES['pipe'][1], (lPipe['x'], lPipe['y']))
 
-        SCREEN.blit(IMAGES['base'], (basex, BASEY))
+        RENDERER.blit(IMAGES['base'], (basex, BASEY))
         # print score so player overlaps the score
         showScore(score)
 
@@ -440,22 +502,59 @@ def mainGame(args, movementInfo):
         if player_rot <= PLAYER_ROT_THR and ENABLE_ROT:
             visibleRot = player_rot
 
-        playerSurface = pygame.transform.rotate(IMAGES['player'][playerIndex], visibleRot)
-        SCREEN.blit(playerSurface, (PLAYER_X, playery))
+        playerSurface = SPRITES.rotated(IMAGES['player'][playerIndex], visibleRot)
+        RENDERER.blit(playerSurface, (PLAYER_X, playery))
 
-        showCalculatedPath(optimal_path, path_frame_start, PLAYER_X, playery, frame_count, SCREEN)
+        # the paths are drawn as seen in the last simulated frame
+        showCalculatedPath(path_points, path_frame_start, PLAYER_X, playery, frame_count - 1, SCREEN)
+        if args.overlay:
+            showProfile(profiler)
 
-        frame_count += 1
+        if profiler:
+            profiler.mark('render')
 
-        pygame.display.update()
-        FPSCLOCK.tick(FPS)
+        RENDERER.update()
+        if profiler:
+            profiler.mark('display')
+
+def showProfile(profiler):
+    """draws the timings and search counters of the profiler in the top left corner"""
+    global FONT
+    if FONT is None:
+        FONT = pygame.font.Font(None, 18)
 
-def showCalculatedPath(all_paths, path_frame_start, current_x, current_y, frame_count, whichscreen):
+    y = 4
+    for line in profiler.overlayLines():
+        RENDERER.blit(FONT.render(line, True, (255, 255, 255), (0, 0, 0)), (4, y))
+        y += FONT.get_linesize()
+
+def pathPoints(all_paths):
     """
-    Draws all calculated paths
+    Converts the paths of a decision into the points of their polylines, once per
+    decision instead of every frame
 
     arguments:
         all_paths        (list)    - list of paths sorted by score
+    returns:
+        path_points      (list)    - array of the points of every path relative to the player's x,
+                                     the first row is left for the player's position in each frame
+    """
+    mid_x, mid_y = IMAGES['player'][0].get_width() / 2, IMAGES['player'][0].get_height() / 2
+
+    path_points = []
+    for _, path in all_paths:
+        points = np.empty((len(path) + 1, 2))
+        points[1:, 0] = mid_x - PIPE_VEL_X * FRAME_SKIP * np.arange(1, len(path) + 1)
+        points[1:, 1] = np.asarray(path) + mid_y
+        path_points.append(points)
+    return path_points
+
+def showCalculatedPath(path_points, path_frame_start, current_x, current_y, frame_count, whichscreen):
+    """
+    Draws all calculated paths, a single polyline per path
+
+    arguments:
+        path_points      (list)    - points of the paths sorted by score, as returned by pathPoints
         path_frame_start (float)   - number of the frame at which the paths were calculated
         current_x        (float)   - current x position of the agent
         current_y        (float)   - current y position of the agent
@@ -467,34 +566,21 @@ def showCalculatedPath(all_paths, path_frame_start, current_x, current_y, frame_
     global SHOW_OTHER_PATHS
     mid_x, mid_y = IMAGES['player'][0].get_width() / 2, IMAGES['player'][0].get_height() / 2
 
-    offset_x = (frame_count - path_frame_start) * PIPE_VEL_X
-    mid_x += offset_x
+    # the paths scroll with the pipes until the next decision
+    offset = np.array([current_x + (frame_count - path_frame_start) * PIPE_VEL_X, 0])
 
-    try:
-        _, best_path = all_paths[0]
-    except:
-        best_path = []
+    paths = []
+    for points in path_points:
+        if len(points) > 1:
+            points[0] = mid_x, current_y + mid_y
+            paths.append((points + offset).tolist())
 
     if SHOW_OTHER_PATHS:
-        for _, path in all_paths:
-            previous_x = deepcopy(current_x)
-            previous_y = deepcopy(current_y)
-            for y in path:
-                x = previous_x - PIPE_VEL_X * FRAME_SKIP
-                pygame.draw.line(SCREEN, (0, 0, 255), (previous_x + mid_x, previous_y + mid_y), (x + mid_x, y + mid_y), 2)
-
-                previous_x = x
-                previous_y = y
+        for points in paths:
+            RENDERER.track(pygame.draw.lines(whichscreen, (0, 0, 255), False, points, 2))
 
-    previous_x = deepcopy(current_x)
-    previous_y = deepcopy(current_y)
-
-    for y in best_path:
-        x = current_x - PIPE_VEL_X * FRAME_SKIP
-        pygame.draw.line(whichscreen, (255, 0, 0), (current_x + mid_x, current_y + mid_y), (x + mid_x, y + mid_y), 2)
-
-        current_x = x
-        current_y = y
+    if paths:
+        RENDERER.track(pygame.draw.lines(whichscreen, (255, 0, 0), False, paths[0], 2))
 
 
 def showGameOverScreen(crashInfo):
@@ -506,7 +592,7 @@ def showGameOverScreen(crashInfo):
     player_vel_y = crashInfo['player_vel_y']
     player_acc_y = 2
     player_rot = crashInfo['player_rot']
-    player_vel_rot = 7
+    player_vel_rot = PLAYER_CRASH_VEL_ROT
 
     basex = crashInfo['basex']
 
@@ -540,228 +626,20 @@ def showGameOverScreen(crashInfo):
                 player_rot -= player_vel_rot
 
         # draw sprites
-        SCREEN.blit(IMAGES['background'], (0,0))
+        RENDERER.clear()
 
         for uPipe, lPipe in zip(upperPipes, lowerPipes):
-            SCREEN.blit(IMAGES['pipe'][0], (uPipe['x'], uPipe['y']))
-            SCREEN.blit(IMAGES['pipe'][1], (lPipe['x'], lPipe['y']))
+            RENDERER.blit(IMAGES['pipe'][0], (uPipe['x'], uPipe['y']))
+            RENDERER.blit(IMAGES['pipe'][1], (lPipe['x'], lPipe['y']))
 
-        SCREEN.blit(IMAGES['base'], (basex, BASEY))
+        RENDERER.blit(IMAGES['base'], (basex, BASEY))
         showScore(score)
 
-        playerSurface = pygame.transform.rotate(IMAGES['player'][1], player_rot)
-        SCREEN.blit(playerSurface, (PLAYER_X,playery))
+        playerSurface = SPRITES.rotated(IMAGES['player'][1], player_rot)
+        RENDERER.blit(playerSurface, (PLAYER_X,playery))
 
         FPSCLOCK.tick(FPS)
-        pygame.display.update()
-
-def scoreFunction(displacement, sigma, cutoff=None):
-    """
-    Gives score given a displacement, currently gaussian distribution because I'm not creative
-
-    arguments:
-        displacement (float) - how far the player is away from the goal
-        sigma        (float) - standard deviation of the distribution
-        cutoff       (float) - at which displacement to award 0 points
-    returns:
-        score        (float) - score corresponding to this displacement
-    """
-    if not cutoff:
-        return np.exp(-np.power(displacement, 2.)/(2*np.power(sigma, 2.)))
-    else:
-        return np.exp(-np.power(displacement, 2.)/(2*np.power(sigma, 2.))) - np.exp(-np.power(cutoff, 2.)/(2*np.power(sigma, 2.)))
-
-class GameState():
-    def __init__(self, _player_y, _player_vel_y, _upper_pipes, _lower_pipes):
-        self.player_y = deepcopy(_player_y)
-        self.player_vel_y = deepcopy(_player_vel_y)
-        self.upper_pipes = deepcopy(_upper_pipes)
-        self.lower_pipes = deepcopy(_lower_pipes)
-
-    def next(self, flap, returnState = False):
-        """
-        This method advances the GameState by 1 tick and checks, whether or not the player crashes.
-        arguments:
-            flap (bool) whether or not the player flaps at the beginning of the tick
-        return:
-            True   -   crash
-            False  -   no crash
-        """
-        global PLAYER_FLAP_ACC
-        global PLAYER_ACC_Y
-        global PLAYER_X
-        global PIPE_VEL_X
-        global BASEY
-
-        flapped = False
-
-        for _ in range(FRAME_SKIP):
-            if self.player_y > -2 * IMAGES['player'][0].get_height() and flap: # check if out of image
-                self.player_vel_y = PLAYER_FLAP_ACC
-                flap = False
-                flapped = True
-
-            # check for crash here; check for all pictures of the agent as it might be flapping
-            for index in range(3):
-                crashTest = checkCrash({'x': PLAYER_X, 'y': self.player_y, 'index': index},
-                                       self.upper_pipes, self.lower_pipes)
-
-                if crashTest[0]:
-                    if returnState:
-                        return True, self
-                    else:
-                        return True
-
-            # player's movement
-            if self.player_vel_y < PLAYER_MAX_VEL_Y and not flapped: # max vel check for friction
-                self.player_vel_y += PLAYER_ACC_Y
-            flapped = False
-
-            playerHeight = IMAGES['player'][0].get_height()
-            self.player_y += min(self.player_vel_y, BASEY - self.player_y - playerHeight)
-
-            # move pipes to left
-            for uPipe, lPipe in zip(self.upper_pipes, self.lower_pipes):
-                uPipe['x'] += PIPE_VEL_X
-                lPipe['x'] += PIPE_VEL_X
-
-        # check for crash here; check for all pictures of the agent as it might be flapping
-        for index in range(3):
-            crashTest = checkCrash({'x': PLAYER_X, 'y': self.player_y, 'index': index},
-                                   self.upper_pipes, self.lower_pipes)
-
-            if crashTest[0]:
-                if returnState:
-                    return True, self
-                else:
-                    return True
-
-        if returnState:
-            return False, self
-        else:
-            return False
-
-    def nextStep(self, flap):
-        """
-        only get the next step without mutation of the global state
-        needed for look-ahead in multi-threaded approach
-
-        by default this only returns the next GameState() object
-
-        arguments:
-            flap        (bool)  - whether or not to flap when starting the simulation
-        returns:
-            state       (GameState) - new game state
-        """
-        nextState = deepcopy(self)
-        result = nextState.next(flap, returnState = True)
-        return result[1]
-
-    def getScore(self):
-        """
-        returns the score of the current GameState
-
-        arguments:
-            none
-        returns:
-            score        (float) - score corresponding to this GameState
-        """
-        global PIPEGAPSIZE
-        goal = SCREENHEIGHT / 2
-
-        pipeW = IMAGES['pipe'][0].get_width()
-        leftest_pipe_u = min(self.upper_pipes, key=lambda p: p['x'] if PLAYER_X < p['x'] + pipeW else np.inf)
-        u_lower_bound = leftest_pipe_u['y'] + IMAGES['pipe'][0].get_height()
-
-        if leftest_pipe_u['x'] < SCREENWIDTH:
-            goal = u_lower_bound + PIPEGAPSIZE/2
-
-        displacement = abs(goal - self.player_y)
-
-        cutoff = PIPEGAPSIZE/2
-        for p in self.upper_pipes:
-            if p['x'] < PLAYER_X < p['x'] + pipeW:
-                cutoff = PIPEGAPSIZE/2 - IMAGES['player'][0].get_height()/2
-
-        return scoreFunction(displacement, cutoff)
-
-class Agent():
-    def getPathScore(self, state):
-        """
-        performs the tree search and returns the best NUM_PATHS_VISIBLE paths
-
-        arguments:
-            state        (GameState) - state from which to start the tree search
-        returns:
-            final_states (list)      - list of scores with corresponding position histories of the best NUM_PATHS_VISIBLE paths
-        """
-        global MAX_DEPTH
-        global MAX_PATHS
-        global NUM_PATHS_VISIBLE
-        #      state, depth, score, list of choices
-        stack = [(state, 0, 0, [state.player_y])]
-        final_states = []
-        max_num = MAX_PATHS
-        while len(stack):
-            state1, curr_depth, score, pos_hist1 = stack.pop()
-            if curr_depth >= MAX_DEPTH:
-                final_states.append((score, pos_hist1))
-                max_num -= 1
-                if not max_num:
-                    break
-                continue
-            state2, pos_hist2 = deepcopy(state1), deepcopy(pos_hist1)
-
-            if not state1.next(True):
-                pos_hist1.append(state1.player_y)
-                stack.append((state1, curr_depth+1, score+state1.getScore(), pos_hist1))
-            if not state2.next(False):
-                pos_hist2.append(state2.player_y)
-                stack.append((state2, curr_depth+1, score+state2.getScore(), pos_hist2))
-
-        final_states.sort(key=itemgetter(0))
-        final_states = final_states[:NUM_PATHS_VISIBLE]
-
-        return final_states
-
-    def findBestDecision(self, state):
-        """
-        finds the best decision for the agent by performing two tree searches
-
-        arguments:
-            state        (GameState) - state for which to decide
-        returns:
-            flap         (bool)      - decision on whether or not to flap next
-            path         (list)      - list of position histories of the best NUM_PATHS_VISIBLE paths
-        """
-        no_flap = deepcopy(state)
-
-        if state.next(True):
-            no_flap.next(False)
-            path = self.getPathScore(no_flap)
-            return False, path
-
-        if no_flap.next(False):
-            path = self.getPathScore(state)
-            return True, path
-
-        flap_states = self.getPathScore(state)
-        no_flap_states = self.getPathScore(no_flap)
-
-        best_traj = flap_states + no_flap_states
-        best_traj.sort(key=itemgetter(0))
-        best_traj = best_traj[:NUM_PATHS_VISIBLE]
-
-        try:
-            flap_score = flap_states[0][0]
-        except IndexError:
-            flap_score = -1
-        try:
-            no_flap_score = no_flap_states[0][0]
-        except IndexError:
-            no_flap_score = -1
-
-        return flap_score > no_flap_score, best_traj
+        RENDERER.update()
 
 def playerShm(playerShm):
     """oscillates the value of playerShm['val'] between 8 and -8"""
@@ -774,20 +652,6 @@ def playerShm(playerShm):
         playerShm['val'] -= 1
 
 
-def getRandomPipe():
-    """returns a randomly generated pipe"""
-    # y of gap between upper and lower pipe
-    gapY = random.randrange(0, int(BASEY * 0.6 - PIPEGAPSIZE))
-    gapY += int(BASEY * 0.2)
-    pipeHeight = IMAGES['pipe'][0].get_height()
-    pipeX = SCREENWIDTH + 10
-
-    return [
-        {'x': pipeX, 'y': gapY - pipeHeight},  # upper pipe
-        {'x': pipeX, 'y': gapY + PIPEGAPSIZE}, # lower pipe
-    ]
-
-
 def showScore(score):
     """displays score in center of screen"""
     scoreDigits = [int(x) for x in list(str(score))]
@@ -799,70 +663,10 @@ def showScore(score):
     Xoffset = (SCREENWIDTH - totalWidth) / 2
 
     for digit in scoreDigits:
-        SCREEN.blit(IMAGES['numbers'][digit], (Xoffset, SCREENHEIGHT * 0.1))
+        RENDERER.blit(IMAGES['numbers'][digit], (Xoffset, SCREENHEIGHT * 0.1))
         Xoffset += IMAGES['numbers'][digit].get_width()
 
 
-def checkCrash(player, upperPipes, lowerPipes):
-    """returns True if player collders with base or pipes."""
-    pi = player['index']
-    player['w'] = IMAGES['player'][0].get_width()
-    player['h'] = IMAGES['player'][0].get_height()
-
-    # if player crashes into ground
-    if player['y'] + player['h'] >= BASEY - 1:
-        return [True, True]
-    else:
-
-        playerRect = pygame.Rect(player['x'], player['y'],
-                      player['w'], player['h'])
-        pipeW = IMAGES['pipe'][0].get_width()
-        pipeH = IMAGES['pipe'][0].get_height()
-
-        for uPipe, lPipe in zip(upperPipes, lowerPipes):
-            # upper and lower pipe rects
-            uPipeRect = pygame.Rect(uPipe['x'], uPipe['y'], pipeW, pipeH)
-            lPipeRect = pygame.Rect(lPipe['x'], lPipe['y'], pipeW, pipeH)
-
-            # player and upper/lower pipe hitmasks
-            pHitMask = HITMASKS['player'][pi]
-            uHitmask = HITMASKS['pipe'][0]
-            lHitmask = HITMASKS['pipe'][1]
-
-            # if bird collided with upipe or lpipe
-            uCollide = pixelCollision(playerRect, uPipeRect, pHitMask, uHitmask)
-            lCollide = pixelCollision(playerRect, lPipeRect, pHitMask, lHitmask)
-
-            if uCollide or lCollide:
-                return [True, False]
-
-    return [False, False]
-
-def pixelCollision(rect1, rect2, hitmask1, hitmask2):
-    """Checks if two objects collide and not just their rects"""
-    rect = rect1.clip(rect2)
-
-    if rect.width == 0 or rect.height == 0:
-        return False
-
-    x1, y1 = rect.x - rect1.x, rect.y - rect1.y
-    x2, y2 = rect.x - rect2.x, rect.y - rect2.y
-
-    for x in range(rect.width):
-        for y in range(rect.height):
-            if hitmask1[x1+x][y1+y] and hitmask2[x2+x][y2+y]:
-                return True
-    return False
-
-def getHitmask(image):
-    """returns a hitmask using an image's alpha."""
-    mask = []
-    for x in range(image.get_width()):
-        mask.append([])
-        for y in range(image.get_height()):
-            mask[x].append(bool(image.get_at((x,y))[3]))
-    return mask
-
 def parse_args(args):
     import argparse
 
@@ -873,8 +677,33 @@ def parse_args(args):
                         help='restrict to single process')
     parser.add_argument('-r', '--restart', action='store_true',
                         help='auto restart at crash')
-
-    return parser.parse_args()
+    parser.add_argument('--planner', choices=sorted(PLANNERS), default='tree',
+                        help='search used by the agent')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes the tree search is spread over')
+    parser.add_argument('--headless', action='store_true',
+                        help='play without display at maximum speed')
+    parser.add_argument('--max-frames', type=int, default=None,
+                        help='end a headless game after this many frames')
+    parser.add_argument('--overlay', action='store_true',
+                        help='show frame timings and search counters on screen')
+    parser.add_argument('--stats', metavar='FILE',
+                        help='write frame timings and search counters as JSON to FILE after every game')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed of the first game, modulo 2**32, the following games count up from it (default: random)')
+    parser.add_argument('--record', metavar='FILE',
+                        help='record every game to FILE, {seed} in FILE is replaced by the seed of the game')
+    parser.add_argument('--replay', metavar='FILE',
+                        help='replay the recorded game instead of running the agent, at maximum speed with --headless')
+    parser.add_argument('--policy', metavar='FILE',
+                        help='decide with the policy distilled into FILE by distill.py instead of searching')
+    parser.add_argument('--policy-threshold', type=float, default=0.,
+                        help='with --policy, let the planner decide when the confidence of the policy is below this (0 to 1)')
+
+    args = parser.parse_args()
+    if args.workers > 1 and args.planner != 'tree':
+        parser.error("--workers only applies to the tree planner")
+    return args
 
 if __name__ == '__main__':
     import sys
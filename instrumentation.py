@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# (C) 2018 Lukas Pilz & Conrad Sachweh
+
+"""
+Optional profiling of the game loop and the search. The hot paths only test
+whether COUNTERS is None, so nothing is counted or timed unless a Profiler
+was created.
+"""
+
+from collections import Counter, defaultdict, deque
+import json
+import time
+
+# search counters, None while profiling is disabled
+COUNTERS = None
+
+# frames and decisions the overlay averages over
+OVERLAY_WINDOW = 30
+
+def enableCounters():
+    """starts counting in the simulation and the agents, returns the counters"""
+    global COUNTERS
+    if COUNTERS is None:
+        COUNTERS = Counter()
+    return COUNTERS
+
+def disableCounters():
+    """stops counting, the hot paths are back to a single test"""
+    global COUNTERS
+    COUNTERS = None
+
+def describe(values):
+    """returns count, mean, p50, p99 and max of a list of numbers"""
+    values = sorted(values)
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values),
+        'p50': values[len(values) // 2],
+        'p99': values[min(len(values) - 1, int(0.99 * len(values)))],
+        'max': values[-1],
+    }
+
+class Profiler():
+    """
+    Records the duration of every phase of every frame and the search counters
+    of every decision. A frame starts with startFrame(), each mark(phase) then
+    books the time since the previous mark to phase; endDecision() books the
+    counters gathered since the previous decision.
+    """
+    def __init__(self):
+        self.counters = enableCounters()
+        self.baseline = Counter(self.counters)
+        self.frames = 0
+        self.times = defaultdict(list)
+        self.searches = defaultdict(list)
+        self.decisions = 0
+        self.recent_times = defaultdict(lambda: deque(maxlen=OVERLAY_WINDOW))
+        self.recent_searches = defaultdict(lambda: deque(maxlen=OVERLAY_WINDOW))
+        self.last = time.perf_counter()
+
+    def startFrame(self):
+        """starts timing a new frame"""
+        self.frames += 1
+        self.last = time.perf_counter()
+
+    def mark(self, phase):
+        """books the time since the last mark to phase"""
+        now = time.perf_counter()
+        duration = now - self.last
+        self.times[phase].append(duration)
+        self.recent_times[phase].append(duration)
+        self.last = now
+
+    def endDecision(self):
+        """books the search counters of the decision that just finished"""
+        self.decisions += 1
+        for name in set(self.counters) | set(self.searches):
+            if name not in self.searches:
+                # counted for the first time, the earlier decisions did not need it
+                self.searches[name] = [0] * (self.decisions - 1)
+            value = self.counters[name] - self.baseline[name]
+            self.searches[name].append(value)
+            self.recent_searches[name].append(value)
+        self.baseline = Counter(self.counters)
+
+    def summary(self):
+        """
+        returns the statistics gathered so far
+
+        arguments:
+            none
+        returns:
+            summary      (dict) - seconds per frame of every phase and counters per decision
+        """
+        return {
+            'frames': self.frames,
+            'decisions': self.decisions,
+            'phases': {phase: describe(times) for phase, times in self.times.items()},
+            'search': {name: dict(describe(values), total=sum(values)) for name, values in self.searches.items()},
+        }
+
+    def dump(self, path):
+        """writes the summary as JSON to path"""
+        with open(path, 'w') as stats:
+            json.dump(self.summary(), stats, indent=2)
+
+    def overlayLines(self):
+        """returns the text of the on-screen overlay, averaged over the last frames and decisions"""
+        lines = []
+        for phase, times in self.recent_times.items():
+            lines.append("{:<17}{:7.2f} ms".format(phase, 1000 * sum(times) / len(times)))
+        for name, values in sorted(self.recent_searches.items()):
+            lines.append("{:<17}{:7.0f}".format(name, sum(values) / len(values)))
+        return lines
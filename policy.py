@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+# (C) 2018 Lukas Pilz & Conrad Sachweh
+
+"""
+Policies distilled from the decisions of the tree search. A Policy is a small
+multilayer perceptron in NumPy over a few features of the player and the next
+two pipes, trained on a trajectory dataset to predict whether the search
+flapped; deciding is a few small matrix products instead of a search.
+"""
+
+import numpy as np
+
+import instrumentation
+from agent import fallbackDecision
+from simulation import PLAYER_X
+from trajectories import nextPipes
+
+# player y, velocity, distance to the first two pipes ahead and height relative to their gaps
+NUM_FEATURES = 6
+HIDDEN = 64
+
+def features(player_y, player_vel_y, pipe0_x, pipe0_gap_y, pipe1_x, pipe1_gap_y):
+    """returns the unnormalized features of one or many decisions, arrays like the columns of a trajectory dataset"""
+    return np.stack(np.broadcast_arrays(
+        np.asarray(player_y, dtype=float),
+        player_vel_y,
+        pipe0_x - PLAYER_X,
+        player_y - pipe0_gap_y,
+        pipe1_x - PLAYER_X,
+        player_y - pipe1_gap_y,
+    ), axis=-1).astype(float)
+
+def stateFeatures(state):
+    """returns the features of a GameState"""
+    (pipe0_x, pipe0_gap_y), (pipe1_x, pipe1_gap_y) = nextPipes(state)
+    return features(state.player_y, state.player_vel_y, pipe0_x, pipe0_gap_y, pipe1_x, pipe1_gap_y)
+
+def datasetFeatures(reader):
+    """
+    returns features and labels of the decisions of a trajectory dataset, leaving out those with a pipe missing
+
+    arguments:
+        reader       (TrajectoryReader) - the dataset, or an array of trajectories.RECORD
+    returns:
+        inputs       (ndarray) - features of every decision, (N, NUM_FEATURES)
+        labels       (ndarray) - whether the search flapped, (N,)
+        games        (ndarray) - game of every decision, (N,)
+    """
+    inputs = features(*(reader[name] for name in ('player_y', 'player_vel_y', 'pipe0_x', 'pipe0_gap_y',
+                                                  'pipe1_x', 'pipe1_gap_y')))
+    complete = np.isfinite(inputs).all(axis=1)
+    return inputs[complete], np.array(reader['flap'], dtype=bool)[complete], np.array(reader['game'])[complete]
+
+def sigmoid(x):
+    """logistic function, without overflow for large |x|"""
+    return 0.5 * (1 + np.tanh(0.5 * x))
+
+class Policy():
+    """
+    Two layer perceptron with tanh hidden units and a sigmoid output, the
+    probability that the search would flap. The features are normalized with
+    the mean and deviation of the training data, stored with the weights.
+    """
+    def __init__(self, weights, mean, std):
+        self.weights = weights
+        self.mean = mean
+        self.std = std
+
+    @classmethod
+    def create(cls, inputs, hidden=HIDDEN, rng=None):
+        """returns an untrained policy normalizing like the training inputs"""
+        rng = np.random.default_rng(rng)
+        weights = [rng.normal(0, 1 / np.sqrt(NUM_FEATURES), (NUM_FEATURES, hidden)), np.zeros(hidden),
+                   rng.normal(0, 1 / np.sqrt(hidden), hidden), np.zeros(())]
+        return cls(weights, inputs.mean(axis=0), inputs.std(axis=0) + 1e-6)
+
+    def forward(self, inputs):
+        """returns the hidden activations and the flap probability of every row of inputs"""
+        w1, b1, w2, b2 = self.weights
+        hidden = np.tanh(((inputs - self.mean) / self.std) @ w1 + b1)
+        return hidden, sigmoid(hidden @ w2 + b2)
+
+    def probability(self, inputs):
+        """returns the probability that the search flaps for every row of inputs"""
+        return self.forward(inputs)[1]
+
+    def train(self, inputs, labels, epochs=20, batch_size=256, learning_rate=3e-3, rng=None):
+        """
+        fits the weights to the labels with Adam on the cross entropy
+
+        arguments:
+            inputs       (ndarray) - unnormalized features, (N, NUM_FEATURES)
+            labels       (ndarray) - whether the search flapped, (N,)
+            epochs       (int)     - passes over the data
+            batch_size   (int)     - decisions per gradient step
+            learning_rate (float)  - step size of Adam
+            rng          (int)     - seed of the shuffling
+        returns:
+            losses       (list)    - mean cross entropy of every epoch
+        """
+        rng = np.random.default_rng(rng)
+        labels = labels.astype(float)
+        moments = [(np.zeros_like(w), np.zeros_like(w)) for w in self.weights]
+        beta1, beta2, steps = 0.9, 0.999, 0
+        losses = []
+        for _ in range(epochs):
+            order = rng.permutation(len(labels))
+            loss = 0.
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                x = (inputs[batch] - self.mean) / self.std
+                w1, b1, w2, b2 = self.weights
+                hidden = np.tanh(x @ w1 + b1)
+                p = sigmoid(hidden @ w2 + b2)
+                y = labels[batch]
+                loss -= np.sum(y * np.log(p + 1e-12) + (1 - y) * np.log(1 - p + 1e-12))
+
+                # gradients of the mean cross entropy
+                d_out = (p - y) / len(batch)
+                d_hidden = np.outer(d_out, w2) * (1 - hidden ** 2)
+                gradients = [x.T @ d_hidden, d_hidden.sum(axis=0), hidden.T @ d_out, d_out.sum()]
+
+                steps += 1
+                for w, g, (m, v) in zip(self.weights, gradients, moments):
+                    m *= beta1
+                    m += (1 - beta1) * g
+                    v *= beta2
+                    v += (1 - beta2) * g ** 2
+                    w -= learning_rate * (m / (1 - beta1 ** steps)) / (np.sqrt(v / (1 - beta2 ** steps)) + 1e-8)
+            losses.append(loss / len(labels))
+        return losses
+
+    def save(self, path):
+        """writes the policy to path as .npz"""
+        np.savez(path, mean=self.mean, std=self.std, **{'w{}'.format(i): w for i, w in enumerate(self.weights)})
+
+    @classmethod
+    def load(cls, path):
+        """reads a policy written by save"""
+        with np.load(path) as data:
+            return cls([data['w{}'.format(i)] for i in range(4)], data['mean'], data['std'])
+
+class PolicyAgent():
+    """
+    Decides with a Policy instead of searching. A decision the policy is not
+    confident about, the probability of flapping closer to 1/2 than threshold/2,
+    is left to the search of the fallback agent, if there is one. So is a state
+    the policy cannot judge, because it was predicted ahead of the game and
+    misses the second pipe; without a fallback agent agent.fallbackDecision()
+    takes it.
+    """
+    def __init__(self, policy, fallback=None, threshold=0.):
+        self.policy = policy
+        self.fallback = fallback
+        self.threshold = threshold
+        self.policy_decisions = 0
+        self.fallback_decisions = 0
+        self.lookahead_decisions = 0
+
+    def statistics(self):
+        """returns the number of decisions taken by the policy and by the fallback"""
+        statistics = self.fallback.statistics() if self.fallback else {}
+        statistics['policy_decisions'] = self.policy_decisions
+        statistics['fallback_decisions'] = self.fallback_decisions
+        statistics['lookahead_decisions'] = self.lookahead_decisions
+        return statistics
+
+    def close(self):
+        """releases the resources of the fallback agent"""
+        if self.fallback:
+            self.fallback.close()
+
+    def findBestDecision(self, state):
+        """
+        decides with the policy, or with the fallback agent if the policy is unsure
+
+        arguments:
+            state        (GameState) - state for which to decide
+        returns:
+            flap         (bool)      - decision on whether or not to flap next
+            path         (list)      - paths of the fallback's search, empty for a decision of the policy
+        """
+        inputs = stateFeatures(state)
+        if not np.isfinite(inputs).all():
+            if self.fallback is None:
+                self.count('lookahead_decisions')
+                return fallbackDecision(state), []
+            self.count('fallback_decisions')
+            return self.fallback.findBestDecision(state)
+
+        probability = float(self.policy.probability(inputs))
+        if self.fallback is not None and abs(2 * probability - 1) < self.threshold:
+            self.count('fallback_decisions')
+            return self.fallback.findBestDecision(state)
+
+        self.count('policy_decisions')
+        return probability > 0.5, []
+
+    def count(self, name):
+        """counts a decision taken by name, in the profiling counters as well"""
+        setattr(self, name, getattr(self, name) + 1)
+        if instrumentation.COUNTERS is not None:
+            instrumentation.COUNTERS[name] += 1
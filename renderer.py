@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# (C) 2018 Lukas Pilz & Conrad Sachweh
+
+"""
+Dirty rectangle rendering of the game. The background is the only part of a
+frame that never moves, so it is kept as a layer of its own: every frame paints
+it over whatever the previous frame drew, draws the sprites at their new place
+and updates the display only where either of both frames drew.
+"""
+
+import pygame
+
+class Renderer():
+    """
+    Draws the frames of the game onto the display surface. A frame starts with
+    clear() and ends with update(); everything drawn in between has to go through
+    blit() or track(), so only those parts of the display are repainted.
+    """
+    def __init__(self, screen):
+        self.screen = screen
+        self.background = None
+        # parts of the display drawn in the current and in the previous frame
+        self.drawn = []
+        self.previous = []
+        self.full_update = True
+
+    def setBackground(self, background):
+        """
+        caches the background layer and paints it, the next update() shows the whole display
+
+        arguments:
+            background   (Surface) - opaque image of the size of the display
+        returns:
+            none
+        """
+        self.background = background.copy()
+        self.screen.blit(self.background, (0, 0))
+        self.drawn, self.previous = [], []
+        self.full_update = True
+
+    def clear(self):
+        """paints the background over everything the previous frame drew"""
+        for rect in self.previous:
+            self.screen.blit(self.background, rect, rect)
+
+    def blit(self, surface, position):
+        """draws surface at position, returns the part of the display it covers"""
+        return self.track(self.screen.blit(surface, position))
+
+    def track(self, rect):
+        """marks rect as drawn, for drawing that bypasses blit() like pygame.draw; returns rect"""
+        if rect.width and rect.height:
+            self.drawn.append(rect)
+        return rect
+
+    def update(self):
+        """shows the frame, repainting only the parts of the display that changed"""
+        if self.full_update:
+            pygame.display.update()
+            self.full_update = False
+        else:
+            pygame.display.update(self.previous + self.drawn)
+        self.previous, self.drawn = self.drawn, []
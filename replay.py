@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+# (C) 2018 Lukas Pilz & Conrad Sachweh
+
+"""
+Recording and replay of games. A recording holds everything that is random or
+decided in a game: the seed, the start height of the player, the gap of every
+pipe and whether the player flapped in each frame. Replaying it reconstructs
+the game frame by frame without running the agent.
+
+File format, little endian: the header HEADER, followed by one uint16 per pipe
+gap and one bit per frame for the flaps, as written by numpy.packbits.
+"""
+
+from itertools import cycle
+import struct
+import numpy as np
+
+from simulation import (PLAYER_X, PLAYER_MAX_VEL_Y, PLAYER_ACC_Y, PLAYER_FLAP_ACC, PLAYER_VEL_Y, PLAYER_HEIGHT, BASEY,
+                        checkCrash, countPassedPipes, getInitialPipes, getRandomGap, movePipes)
+
+MAGIC = b'FLRC'
+VERSION = 1
+# magic, version, seed, start height, score and frames of the game, number of gaps, number of flap bits
+HEADER = struct.Struct('<4sBIhIIII')
+
+class Recording():
+    """
+    Gaps and flaps of a single game, filled while the game is played by
+    recordGaps() and addFrame(), or read from a file by load().
+    """
+    def __init__(self, seed=0):
+        self.seed = seed
+        self.player_y = 0
+        self.gaps = []
+        self.flaps = []
+        self.score = 0
+        self.frames = 0
+
+    def recordGaps(self, gaps=None):
+        """yields the pipe gaps of the iterator gaps, random ones like getRandomPipe if None, keeping every one of them"""
+        while True:
+            gapY = getRandomGap() if gaps is None else next(gaps)
+            self.gaps.append(gapY)
+            yield gapY
+
+    def replayGaps(self):
+        """yields the recorded pipe gaps, then random ones for a replay running past the end of the recording"""
+        yield from list(self.gaps)
+        while True:
+            yield getRandomGap()
+
+    def cut(self):
+        """returns whether the game was stopped before the player crashed, the crash frame is recorded otherwise"""
+        return len(self.flaps) == self.frames
+
+    def addFrame(self, flapped):
+        """records whether the player flapped in the current frame"""
+        self.flaps.append(bool(flapped))
+
+    def flapped(self, frame):
+        """returns whether the player flapped in frame, False after the end of the recording"""
+        return frame < len(self.flaps) and self.flaps[frame]
+
+    def finish(self, crashInfo):
+        """records the outcome of the game, to compare a replay against"""
+        self.score = crashInfo['score']
+        self.frames = crashInfo['frames']
+
+    def save(self, path):
+        """writes the recording to path"""
+        with open(path, 'wb') as recording:
+            recording.write(HEADER.pack(MAGIC, VERSION, self.seed, int(self.player_y), self.score, self.frames,
+                                        len(self.gaps), len(self.flaps)))
+            recording.write(np.array(self.gaps, dtype='<u2').tobytes())
+            recording.write(np.packbits(np.array(self.flaps, dtype=bool)).tobytes())
+
+    @classmethod
+    def load(cls, path):
+        """
+        reads a recording written by save
+
+        arguments:
+            path         (str)       - file to read
+        returns:
+            recording    (Recording) - the recorded game
+        """
+        with open(path, 'rb') as recording:
+            data = recording.read()
+
+        magic, version, seed, player_y, score, frames, num_gaps, num_flaps = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is no recording of version {}".format(path, VERSION))
+
+        self = cls(seed)
+        self.player_y = player_y
+        self.score, self.frames = score, frames
+        offset = HEADER.size
+        self.gaps = np.frombuffer(data, dtype='<u2', count=num_gaps, offset=offset).tolist()
+        offset += 2 * num_gaps
+        flaps = np.unpackbits(np.frombuffer(data, dtype=np.uint8, offset=offset), count=num_flaps)
+        self.flaps = flaps.astype(bool).tolist()
+        return self
+
+def replayGame(recording, max_frames=None):
+    """
+    Replays a recorded game without display at maximum speed, with the rules of simulation.playGame
+
+    arguments:
+        recording    (Recording) - game to replay
+        max_frames   (int)       - stop the replay after this many frames, None to play as long as the recording
+    returns:
+        crashInfo    (dict)      - final state of the game, same keys as simulation.playGame
+    """
+    if max_frames is None and recording.cut():
+        max_frames = recording.frames
+
+    score = playerIndex = loopIter = 0
+    playerIndexGen = cycle([0, 1, 2, 1])
+    playery = recording.player_y
+
+    gaps = recording.replayGaps()
+    upperPipes, lowerPipes = getInitialPipes(gaps)
+
+    frame_count = 0
+    player_vel_y = PLAYER_VEL_Y
+
+    while max_frames is None or frame_count < max_frames:
+        playerFlapped = recording.flapped(frame_count)
+        if playerFlapped:
+            player_vel_y = PLAYER_FLAP_ACC
+
+        # check for crash here
+        crashTest = checkCrash({'x': PLAYER_X, 'y': playery, 'index': playerIndex},
+                               upperPipes, lowerPipes)
+        if crashTest[0]:
+            break
+
+        # check for score
+        score += countPassedPipes(upperPipes)
+
+        # playerIndex change
+        if (loopIter + 1) % 3 == 0:
+            playerIndex = next(playerIndexGen)
+        loopIter = (loopIter + 1) % 30
+
+        # player's movement
+        if player_vel_y < PLAYER_MAX_VEL_Y and not playerFlapped:
+            player_vel_y += PLAYER_ACC_Y
+
+        playery += min(player_vel_y, BASEY - playery - PLAYER_HEIGHT)
+
+        movePipes(upperPipes, lowerPipes, gaps)
+
+        frame_count += 1
+    else:
+        crashTest = [False, False]
+
+    return {
+        'y': playery,
+        'groundCrash': crashTest[1],
+        'upperPipes': upperPipes,
+        'lowerPipes': lowerPipes,
+        'score': score,
+        'player_vel_y': player_vel_y,
+        'frames': frame_count,
+        'decisions': 0,
+    }
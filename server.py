@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# (C) 2018 Lukas Pilz & Conrad Sachweh
+
+"""NAME
+        %(prog)s - serves headless games to external controllers
+
+SYNOPSIS
+        %(prog)s [--help]
+
+DESCRIPTION
+        Hosts any number of concurrent headless games on a local TCP
+        or Unix socket. A controller opens sessions and drives each of
+        them with reset, step and observe requests; a single step
+        request can carry the decisions of many ticks. Client is a
+        blocking client of the protocol for controllers in Python.
+
+PROTOCOL
+        Little endian. A request is REQUEST (operation, session, seed,
+        number of decisions), followed by one byte per decision for a
+        STEP. Each request is answered by one RESPONSE of fixed size:
+        status, session, ticks played and pipes passed by the request,
+        then the observation of the session: player y and velocity,
+        score, frames, whether it crashed, the number of pipes and x,
+        upper y and lower y of MAX_PIPES pipes, unused ones zero.
+        Requests can be pipelined, the responses come in order.
+
+AUTHOR
+        Lukas Pilz, <email>
+        Conrad Sachweh, conrad@csachweh.de
+"""
+
+import asyncio
+from itertools import count, cycle
+import os
+import random
+import socket
+import struct
+import sys
+
+# keep the output free of the pygame banner
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+from simulation import (SCREENHEIGHT, BASEY, AGENT_FREQ, PLAYER_X, PLAYER_HEIGHT, PLAYER_VEL_Y, PLAYER_MAX_VEL_Y,
+                        PLAYER_ACC_Y, PLAYER_FLAP_ACC, checkCrash, countPassedPipes, getInitialPipes, getRandomGap,
+                        movePipes)
+from batchenv import MAX_PIPES
+
+# operations of a request
+NEW, RESET, STEP, OBSERVE, CLOSE = range(1, 6)
+# status of a response
+OK, UNKNOWN_SESSION, BAD_REQUEST = range(3)
+
+# operation, session, seed, number of decisions following
+REQUEST = struct.Struct('<BIIH')
+# status, session, ticks played, pipes passed, player y, velocity, score, frames, crashed,
+# number of pipes and x, upper y, lower y of every pipe
+RESPONSE = struct.Struct('<BIHHdhIIBB' + 'hhh' * MAX_PIPES)
+
+class Session():
+    """
+    A headless game played decision by decision with the rules of
+    simulation.playGame. The pipe gaps come from a random generator of its
+    own, so a session with seed plays the pipes of playGame after
+    random.seed(seed).
+    """
+    def __init__(self, seed=0):
+        self.reset(seed)
+
+    def reset(self, seed):
+        """starts a new game with the pipes of seed"""
+        rng = random.Random(seed)
+        self.gaps = (getRandomGap(rng) for _ in count())
+        self.upper_pipes, self.lower_pipes = getInitialPipes(self.gaps)
+        self.player_y = int((SCREENHEIGHT - PLAYER_HEIGHT) / 2)
+        self.player_vel_y = PLAYER_VEL_Y
+        self.player_index = self.loop_iter = 0
+        self.player_index_gen = cycle([0, 1, 2, 1])
+        self.score = self.frames = 0
+        self.crashed = False
+
+    def step(self, flaps):
+        """
+        plays one tick of AGENT_FREQ frames per decision, until the player crashes
+
+        arguments:
+            flaps        (bytes) - whether the player flaps at the beginning of each tick
+        returns:
+            ticks        (int)   - number of ticks played, less than decisions after a crash
+            passed       (int)   - number of pipes passed during these ticks
+        """
+        ticks = passed = 0
+        for flap in flaps:
+            if self.crashed:
+                break
+            ticks += 1
+
+            for frame in range(AGENT_FREQ):
+                # the player only decides while inside the screen
+                flapped = flap and not frame and self.player_y > -2 * PLAYER_HEIGHT
+                if flapped:
+                    self.player_vel_y = PLAYER_FLAP_ACC
+
+                if checkCrash({'x': PLAYER_X, 'y': self.player_y, 'index': self.player_index},
+                              self.upper_pipes, self.lower_pipes)[0]:
+                    self.crashed = True
+                    break
+
+                pipes = countPassedPipes(self.upper_pipes)
+                self.score += pipes
+                passed += pipes
+
+                if (self.loop_iter + 1) % 3 == 0:
+                    self.player_index = next(self.player_index_gen)
+                self.loop_iter = (self.loop_iter + 1) % 30
+
+                if self.player_vel_y < PLAYER_MAX_VEL_Y and not flapped:
+                    self.player_vel_y += PLAYER_ACC_Y
+                self.player_y += min(self.player_vel_y, BASEY - self.player_y - PLAYER_HEIGHT)
+
+                movePipes(self.upper_pipes, self.lower_pipes, self.gaps)
+                self.frames += 1
+        return ticks, passed
+
+    def response(self, session, ticks=0, passed=0):
+        """returns the RESPONSE carrying the observation of this session"""
+        pipes = []
+        for uPipe, lPipe in list(zip(self.upper_pipes, self.lower_pipes))[:MAX_PIPES]:
+            pipes += (int(uPipe['x']), uPipe['y'], lPipe['y'])
+        pipes += [0] * (3 * MAX_PIPES - len(pipes))
+        return RESPONSE.pack(OK, session, ticks, passed, self.player_y, self.player_vel_y, self.score,
+                             self.frames, self.crashed, min(len(self.upper_pipes), MAX_PIPES), *pipes)
+
+def errorResponse(status, session):
+    """returns the RESPONSE of a failed request"""
+    return RESPONSE.pack(status, session, 0, 0, 0, 0, 0, 0, False, 0, *[0] * (3 * MAX_PIPES))
+
+class GameServer():
+    """
+    Hosts the sessions of all connections. Any connection can drive any
+    session, the sessions opened by a connection are closed when it ends.
+    """
+    def __init__(self, verbose=0):
+        self.verbose = verbose
+        self.sessions = {}
+        self.session_ids = count(1)
+
+    def handle(self, operation, session, seed, flaps, opened):
+        """
+        answers a single request
+
+        arguments:
+            operation    (int)   - NEW, RESET, STEP, OBSERVE or CLOSE
+            session      (int)   - session the request is for, ignored by NEW
+            seed         (int)   - seed of the pipes for NEW and RESET
+            flaps        (bytes) - decisions of a STEP
+            opened       (set)   - sessions opened by the connection
+        returns:
+            response     (bytes) - RESPONSE to send back
+        """
+        if operation == NEW:
+            session = next(self.session_ids)
+            self.sessions[session] = Session(seed)
+            opened.add(session)
+            return self.sessions[session].response(session)
+
+        game = self.sessions.get(session)
+        if game is None:
+            return errorResponse(UNKNOWN_SESSION, session)
+
+        if operation == STEP:
+            return game.response(session, *game.step(flaps))
+        if operation == OBSERVE:
+            return game.response(session)
+        if operation == RESET:
+            game.reset(seed)
+            return game.response(session)
+        if operation == CLOSE:
+            del self.sessions[session]
+            opened.discard(session)
+            return game.response(session)
+        return errorResponse(BAD_REQUEST, session)
+
+    async def serve(self, reader, writer):
+        """answers the requests of a connection until it is closed"""
+        opened = set()
+        try:
+            while True:
+                operation, session, seed, decisions = REQUEST.unpack(await reader.readexactly(REQUEST.size))
+                flaps = await reader.readexactly(decisions) if decisions else b''
+                writer.write(self.handle(operation, session, seed, flaps, opened))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for session in opened:
+                self.sessions.pop(session, None)
+            writer.close()
+            if self.verbose:
+                print("connection closed, {} sessions left".format(len(self.sessions)), file=sys.stderr)
+
+    async def run(self, host='127.0.0.1', port=0, path=None):
+        """
+        serves clients on a Unix socket at path or on a TCP port, until cancelled
+
+        arguments:
+            host         (str)  - address of the TCP socket
+            port         (int)  - TCP port, 0 for any free one
+            path         (str)  - path of the Unix socket, None for TCP
+        returns:
+            none
+        """
+        if path:
+            server = await asyncio.start_unix_server(self.serve, path)
+        else:
+            server = await asyncio.start_server(self.serve, host, port)
+        for listening in server.sockets:
+            print("serving on {}".format(listening.getsockname()), file=sys.stderr, flush=True)
+        async with server:
+            await server.serve_forever()
+
+class Client():
+    """
+    Blocking client of the protocol. Observations are dicts of the RESPONSE
+    fields, with the pipes as lists of dicts like those of a GameState.
+    """
+    def __init__(self, address):
+        if isinstance(address, str):
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.socket.connect(address)
+        self.stream = self.socket.makefile('rb')
+
+    def send(self, operation, session=0, seed=0, flaps=()):
+        """sends a request without waiting for its response, to pipeline several ones"""
+        self.socket.sendall(REQUEST.pack(operation, session, seed, len(flaps)) + bytes(bool(flap) for flap in flaps))
+
+    def receive(self):
+        """
+        returns the response to the oldest request not answered yet
+
+        arguments:
+            none
+        returns:
+            observation  (dict) - session, ticks, passed, player_y, player_vel_y, score, frames,
+                                  crashed, upper_pipes and lower_pipes
+        """
+        data = self.stream.read(RESPONSE.size)
+        if len(data) < RESPONSE.size:
+            raise ConnectionError("server closed the connection")
+        values = RESPONSE.unpack(data)
+        status, session, ticks, passed, player_y, player_vel_y, score, frames, crashed, num_pipes = values[:10]
+        if status != OK:
+            raise ValueError("request for session {} failed with status {}".format(session, status))
+        pipes = values[10:]
+        return {
+            'session': session,
+            'ticks': ticks,
+            'passed': passed,
+            'player_y': player_y,
+            'player_vel_y': player_vel_y,
+            'score': score,
+            'frames': frames,
+            'crashed': bool(crashed),
+            'upper_pipes': [{'x': pipes[3 * i], 'y': pipes[3 * i + 1]} for i in range(num_pipes)],
+            'lower_pipes': [{'x': pipes[3 * i], 'y': pipes[3 * i + 2]} for i in range(num_pipes)],
+        }
+
+    def request(self, operation, session=0, seed=0, flaps=()):
+        """sends a request and returns its response"""
+        self.send(operation, session, seed, flaps)
+        return self.receive()
+
+    def new(self, seed=0):
+        """opens a session playing the pipes of seed"""
+        return self.request(NEW, seed=seed)
+
+    def reset(self, session, seed=0):
+        """restarts the game of a session"""
+        return self.request(RESET, session, seed)
+
+    def step(self, session, flaps):
+        """plays one tick per decision in flaps, stopping at a crash"""
+        return self.request(STEP, session, flaps=flaps)
+
+    def observe(self, session):
+        """returns the observation of a session without changing it"""
+        return self.request(OBSERVE, session)
+
+    def close(self, session):
+        """ends a session, returns its last observation"""
+        return self.request(CLOSE, session)
+
+    def disconnect(self):
+        """closes the connection, the server closes the sessions opened by it"""
+        self.stream.close()
+        self.socket.close()
+
+def main(args):
+    args = parse_args(args)
+    try:
+        asyncio.run(GameServer(args.verbose).run(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+def parse_args(args):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="MyOptions")
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help='report connections on stderr')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='address to listen on')
+    parser.add_argument('--port', type=int, default=7777,
+                        help='TCP port to listen on')
+    parser.add_argument('--unix', metavar='PATH',
+                        help='listen on a Unix socket at PATH instead of TCP')
+
+    return parser.parse_args(args[1:])
+
+if __name__ == '__main__':
+    main(sys.argv[:])
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+# (C) 2018 Lukas Pilz & Conrad Sachweh
+
+"""
+A headless game shared with an agent in another process without pickling.
+The game writes every observation as a fixed-size record into a ring buffer in
+shared memory and reads the decision back from an action slot next to it; the
+agent attaches to the same memory by name and reads the records through NumPy
+views.
+
+Layout of the shared memory: HEADER_FIELDS int64 counters, followed by a ring
+of records in the layout of server.RESPONSE, described to NumPy by OBSERVATION.
+The session field of a record holds the number of the game, starting at 0.
+Game and agent take turns: the game publishes a record and waits until the
+agent acted on it, the agent waits for a new record and acts on it. Each side
+only writes its own counter, and only after the data the counter announces.
+"""
+
+import os
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from server import RESPONSE, Session
+from batchenv import MAX_PIPES
+from simulation import GameState
+
+# records kept in the ring, the agent can look back at as many observations
+RING_SLOTS = 64
+
+# int64 fields of the header: records published by the game, number of the record the agent acted on,
+# the action and the number of ring slots
+PUBLISHED, ACTED, ACTION, SLOTS = range(4)
+HEADER_FIELDS = 8
+HEADER_SIZE = 8 * HEADER_FIELDS
+
+# actions of the agent, STOP ends the game's loop
+NO_FLAP, FLAP, STOP = range(3)
+
+# a record of the ring as NumPy sees it, field by field the layout of server.RESPONSE
+OBSERVATION = np.dtype([
+    ('status', 'u1'),
+    ('session', '<u4'),
+    ('ticks', '<u2'),
+    ('passed', '<u2'),
+    ('player_y', '<f8'),
+    ('player_vel_y', '<i2'),
+    ('score', '<u4'),
+    ('frames', '<u4'),
+    ('crashed', 'u1'),
+    ('num_pipes', 'u1'),
+    # x, upper y and lower y of every pipe
+    ('pipes', '<i2', (MAX_PIPES, 3)),
+])
+assert OBSERVATION.itemsize == RESPONSE.size
+
+def attachMemory(name):
+    """
+    Attaches to existing shared memory without making this process responsible
+    for it: before Python 3.13 the resource tracker of a process that did not
+    inherit one would remove the memory when that process ends.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        inherited = getattr(resource_tracker._resource_tracker, '_fd', None) is not None
+        memory = shared_memory.SharedMemory(name=name)
+        if not inherited:
+            resource_tracker.unregister(memory._name, 'shared_memory')
+        return memory
+
+def wait(condition):
+    """spins until condition() holds, giving the other side the core meanwhile"""
+    while not condition():
+        os.sched_yield()
+
+class SharedGame():
+    """
+    The game side, owner of the shared memory. run() plays with the rules of
+    simulation.playGame, one tick per action; after a crash, or after
+    max_frames frames, the next action starts a new game whose pipes come from
+    the following seed.
+    """
+    def __init__(self, seed=0, slots=RING_SLOTS, name=None):
+        self.memory = shared_memory.SharedMemory(name=name, create=True, size=HEADER_SIZE + slots * RESPONSE.size)
+        self.name = self.memory.name
+        self.header = np.ndarray(HEADER_FIELDS, dtype='<i8', buffer=self.memory.buf)
+        self.header[:] = 0
+        self.header[SLOTS] = slots
+        self.slots = slots
+        self.seed = seed
+        self.games = 0
+        self.game = Session(seed)
+
+    def publish(self, ticks=0, passed=0):
+        """writes the observation of the current game into the next slot of the ring"""
+        published = int(self.header[PUBLISHED])
+        offset = HEADER_SIZE + published % self.slots * RESPONSE.size
+        self.memory.buf[offset:offset + RESPONSE.size] = self.game.response(self.games, ticks, passed)
+        self.header[PUBLISHED] = published + 1
+
+    def waitAction(self):
+        """returns the action on the last published record, once the agent took it"""
+        header = self.header
+        wait(lambda: header[ACTED] == header[PUBLISHED])
+        return int(header[ACTION])
+
+    def run(self, max_frames=None):
+        """
+        publishes observations and plays the actions on them until the agent sends STOP
+
+        arguments:
+            max_frames   (int) - start a new game after this many frames, None to play until the crash
+        returns:
+            steps        (int) - number of actions played
+        """
+        steps = 0
+        self.publish()
+        while True:
+            action = self.waitAction()
+            if action == STOP:
+                return steps
+            steps += 1
+            if self.game.crashed or (max_frames is not None and self.game.frames >= max_frames):
+                self.games += 1
+                self.game.reset(self.seed + self.games)
+                self.publish()
+            else:
+                self.publish(*self.game.step((action,)))
+
+    def close(self):
+        """releases and removes the shared memory"""
+        self.header = None
+        self.memory.close()
+        self.memory.unlink()
+
+class SharedObservations():
+    """
+    The agent side, attached to the memory of a SharedGame by its name. The
+    records are a NumPy array viewing the ring, nothing is copied until a
+    field is read.
+    """
+    def __init__(self, name):
+        self.memory = attachMemory(name)
+        self.header = np.ndarray(HEADER_FIELDS, dtype='<i8', buffer=self.memory.buf)
+        self.slots = int(self.header[SLOTS])
+        self.records = np.ndarray(self.slots, dtype=OBSERVATION, buffer=self.memory.buf, offset=HEADER_SIZE)
+
+    def wait(self):
+        """
+        waits for the observation the game published next
+
+        arguments:
+            none
+        returns:
+            record       (void) - view of the newest record, see OBSERVATION
+        """
+        header = self.header
+        wait(lambda: header[PUBLISHED] > header[ACTED])
+        return self.records[(int(header[PUBLISHED]) - 1) % self.slots]
+
+    def history(self, count):
+        """returns views of the last count records, oldest first; count is at most the number of slots"""
+        published = int(self.header[PUBLISHED])
+        return self.records[np.arange(published - count, published) % self.slots]
+
+    def act(self, action):
+        """answers the newest record with NO_FLAP, FLAP or STOP"""
+        self.header[ACTION] = action
+        self.header[ACTED] = self.header[PUBLISHED]
+
+    def close(self):
+        """detaches from the shared memory, the game removes it"""
+        self.header = self.records = None
+        self.memory.close()
+
+def getGameState(record):
+    """returns the GameState of a record, e.g. to let an Agent decide on it"""
+    pipes = record['pipes'][:record['num_pipes']].tolist()
+    upperPipes = [{'x': x, 'y': upper_y} for x, upper_y, _ in pipes]
+    lowerPipes = [{'x': x, 'y': lower_y} for x, _, lower_y in pipes]
+    return GameState(float(record['player_y']), int(record['player_vel_y']), upperPipes, lowerPipes)
@@ -0,0 +1,700 @@
+# -*- coding: utf-8 -*-
+# (C) 2018 Lukas Pilz & Conrad Sachweh
+
+"""
+Display-free simulation core of the game.
+
+Physics constants, pipe generation, the crash test and the scoring of game
+states live here, so the agent can run without a window. The hitmasks are
+read once from the sprite PNGs when this module is imported; nothing in here
+touches pygame.display.
+"""
+
+from itertools import cycle
+import hashlib
+import os
+import random
+import tempfile
+import zipfile
+import numpy as np
+
+import pygame
+
+import instrumentation
+
+FPS = 30
+SCREENWIDTH  = 288
+SCREENHEIGHT = 512
+PIPEGAPSIZE  = 100 # gap between upper and lower part of pipe
+BASEY        = SCREENHEIGHT * 0.79
+FRAME_SKIP = 2
+AGENT_FREQ = FRAME_SKIP
+
+PLAYER_X = int(SCREENWIDTH * 0.2)
+PIPE_VEL_X = -4
+
+# player velocity, max velocity, downward accleration, accleration on flap
+PLAYER_VEL_Y_DEFAULT = -9
+PLAYER_VEL_Y = PLAYER_VEL_Y_DEFAULT  # player's velocity along Y, default same as playerFlapped
+PLAYER_MAX_VEL_Y =  10   # max vel along Y, max descend speed
+PLAYER_MIN_VEL_Y =  -8   # min vel along Y, max ascend speed TODO: implement?
+PLAYER_ACC_Y    =   1   # players downward accleration
+PLAYER_FLAP_ACC =  -9   # players speed on flapping
+
+# list of all possible players (tuple of 3 positions of flap)
+PLAYERS_LIST = (
+    # red bird
+    (
+        'assets/sprites/redbird-upflap.png',
+        'assets/sprites/redbird-midflap.png',
+        'assets/sprites/redbird-downflap.png',
+    ),
+    # blue bird
+    (
+        'assets/sprites/bluebird-upflap.png',
+        'assets/sprites/bluebird-midflap.png',
+        'assets/sprites/bluebird-downflap.png',
+    ),
+    # yellow bird
+    (
+        'assets/sprites/yellowbird-upflap.png',
+        'assets/sprites/yellowbird-midflap.png',
+        'assets/sprites/yellowbird-downflap.png',
+    ),
+)
+
+# list of backgrounds
+BACKGROUNDS_LIST = (
+    'assets/sprites/background-day.png',
+    'assets/sprites/background-night.png',
+)
+
+# list of pipes
+PIPES_LIST = (
+    'assets/sprites/pipe-green.png',
+    'assets/sprites/pipe-red.png',
+)
+
+# hitmask dict, filled by loadHitmasks()
+HITMASKS = {}
+
+# collision table, filled by loadCollisionTable(), and the same for any player frame
+COLLISION_TABLE = None
+COLLISION_TABLE_ANY = None
+COLLISION_TABLE_CACHE = '.cache/collision_table.npz'
+
+def assetPath(path):
+    """returns the absolute path of an asset, independent of the working directory"""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+
+def getHitmask(image):
+    """returns a hitmask using an image's alpha, as boolean array indexed [x, y]."""
+    return pygame.surfarray.array_alpha(image) > 0
+
+def loadHitmasks():
+    """
+    Reads the hitmasks of player and pipe from the sprite PNGs. All bird colours
+    share one silhouette and both pipe colours one shape, so the first sprite
+    of each list stands in for all of them.
+
+    arguments:
+        none
+    returns:
+        none
+    """
+    global PLAYER_WIDTH, PLAYER_HEIGHT, PIPE_WIDTH, PIPE_HEIGHT
+
+    player = [pygame.image.load(assetPath(path)) for path in PLAYERS_LIST[0]]
+    pipe = pygame.image.load(assetPath(PIPES_LIST[0]))
+
+    HITMASKS['player'] = tuple(getHitmask(image) for image in player)
+    HITMASKS['pipe'] = (
+        getHitmask(pygame.transform.rotate(pipe, 180)),
+        getHitmask(pipe),
+    )
+
+    PLAYER_WIDTH, PLAYER_HEIGHT = player[0].get_size()
+    PIPE_WIDTH, PIPE_HEIGHT = pipe.get_size()
+
+def buildCollisionTable():
+    """
+    Precomputes for every bird frame and both pipe hitmasks whether they overlap
+    at a given offset. Entry [index, pipe, dx, dy] belongs to a pipe whose top left
+    corner lies (dx - PIPE_WIDTH + 1, dy - PIPE_HEIGHT + 1) pixels away from the
+    one of the player; offsets outside of the table can't overlap at all.
+
+    arguments:
+        none
+    returns:
+        table        (ndarray) - boolean array of shape (3, 2, PLAYER_WIDTH + PIPE_WIDTH - 1, PLAYER_HEIGHT + PIPE_HEIGHT - 1)
+    """
+    table = np.zeros((len(HITMASKS['player']), len(HITMASKS['pipe']),
+                      PLAYER_WIDTH + PIPE_WIDTH - 1, PLAYER_HEIGHT + PIPE_HEIGHT - 1), dtype=bool)
+
+    for index, pHitmask in enumerate(HITMASKS['player']):
+        for pipe, hitmask in enumerate(HITMASKS['pipe']):
+            # every solid player pixel marks all offsets at which it lies on a solid pipe pixel
+            flipped = hitmask[::-1, ::-1]
+            for x, y in zip(*np.nonzero(pHitmask)):
+                table[index, pipe, x:x+PIPE_WIDTH, y:y+PIPE_HEIGHT] |= flipped
+
+    return table
+
+def loadCollisionTable(path=COLLISION_TABLE_CACHE):
+    """
+    Loads the collision table from the disk cache, or builds and caches it if the
+    cache is missing or was built from different hitmasks.
+
+    arguments:
+        path         (str) - cache file relative to the repository, None to disable caching
+    returns:
+        none
+    """
+    global COLLISION_TABLE, COLLISION_TABLE_ANY
+
+    digest = hashlib.sha1()
+    for hitmask in HITMASKS['player'] + HITMASKS['pipe']:
+        digest.update(np.packbits(hitmask).tobytes())
+        digest.update(str(hitmask.shape).encode())
+    digest = digest.hexdigest()
+
+    if path:
+        path = assetPath(path)
+        try:
+            with np.load(path) as cache:
+                if str(cache['digest']) == digest:
+                    COLLISION_TABLE = cache['table']
+                    COLLISION_TABLE_ANY = COLLISION_TABLE.any(axis=0)
+                    return
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            pass # missing, outdated or damaged, e.g. by a process killed while writing it
+
+    COLLISION_TABLE = buildCollisionTable()
+    COLLISION_TABLE_ANY = COLLISION_TABLE.any(axis=0)
+
+    if path:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # written next to the cache and renamed, so no process ever reads a partial file
+            fd, temporary = tempfile.mkstemp(suffix='.npz', dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, 'wb') as cache:
+                    np.savez_compressed(cache, digest=digest, table=COLLISION_TABLE)
+                os.chmod(temporary, 0o644)
+                os.replace(temporary, path)
+            except BaseException:
+                os.remove(temporary)
+                raise
+        except OSError:
+            pass # a read-only checkout simply rebuilds the table on every start
+
+loadHitmasks()
+loadCollisionTable()
+
+def scoreFunction(displacement, sigma, cutoff=None):
+    """
+    Gives score given a displacement, currently gaussian distribution because I'm not creative
+
+    arguments:
+        displacement (float) - how far the player is away from the goal
+        sigma        (float) - standard deviation of the distribution
+        cutoff       (float) - at which displacement to award 0 points
+    returns:
+        score        (float) - score corresponding to this displacement
+    """
+    if not cutoff:
+        return np.exp(-np.power(displacement, 2.)/(2*np.power(sigma, 2.)))
+    else:
+        return np.exp(-np.power(displacement, 2.)/(2*np.power(sigma, 2.))) - np.exp(-np.power(cutoff, 2.)/(2*np.power(sigma, 2.)))
+
+class GameState():
+    """
+    Player and pipes the agent searches from. A state is never modified once
+    created: advance() returns a new state sharing the pipe lists, so only the
+    player's y, its velocity and the distance the pipes moved since the snapshot
+    are stored per state.
+    """
+    __slots__ = ('player_y', 'player_vel_y', 'upper_pipes', 'lower_pipes', 'shift',
+                 'score_parameters', 'pipe_keys')
+
+    def __init__(self, _player_y, _player_vel_y, _upper_pipes, _lower_pipes, _shift=0):
+        self.player_y = _player_y
+        self.player_vel_y = _player_vel_y
+        # copy the pipes once, the game keeps moving its own ones
+        self.upper_pipes = [dict(p) for p in _upper_pipes]
+        self.lower_pipes = [dict(p) for p in _lower_pipes]
+        self.shift = _shift
+        # score parameters and pipe keys per shift, shared by all states with the same pipes
+        self.score_parameters = {}
+        self.pipe_keys = {}
+
+    def child(self, player_y, player_vel_y, shift):
+        """returns a new GameState sharing the pipes of this one"""
+        state = GameState.__new__(GameState)
+        state.player_y = player_y
+        state.player_vel_y = player_vel_y
+        state.upper_pipes = self.upper_pipes
+        state.lower_pipes = self.lower_pipes
+        state.shift = shift
+        state.score_parameters = self.score_parameters
+        state.pipe_keys = self.pipe_keys
+        return state
+
+    def simulate(self, flap):
+        """
+        Simulates 1 tick from this GameState and checks, whether or not the player crashes.
+
+        arguments:
+            flap         (bool)  - whether or not the player flaps at the beginning of the tick
+        returns:
+            crash        (bool)  - whether the player crashed
+            player_y     (float) - y position reached, at the moment of the crash if crashed
+            player_vel_y (int)   - velocity reached
+            shift        (int)   - distance the pipes moved since the snapshot
+        """
+        player_y, player_vel_y, shift = self.player_y, self.player_vel_y, self.shift
+        upperPipes, lowerPipes = self.upper_pipes, self.lower_pipes
+
+        for _ in range(FRAME_SKIP):
+            flapped = False
+            if player_y > -2 * PLAYER_HEIGHT and flap: # check if out of image
+                player_vel_y = PLAYER_FLAP_ACC
+                flap = False
+                flapped = True
+
+            # check for crash here; check for all pictures of the agent as it might be flapping
+            if checkCrashAnyFrame(player_y, upperPipes, lowerPipes, shift):
+                return True, player_y, player_vel_y, shift
+
+            # player's movement
+            if player_vel_y < PLAYER_MAX_VEL_Y and not flapped: # max vel check for friction
+                player_vel_y += PLAYER_ACC_Y
+
+            player_y += min(player_vel_y, BASEY - player_y - PLAYER_HEIGHT)
+
+            # move pipes to left
+            shift += PIPE_VEL_X
+
+        crash = checkCrashAnyFrame(player_y, upperPipes, lowerPipes, shift)
+        return crash, player_y, player_vel_y, shift
+
+    def advance(self, flap):
+        """
+        advances the GameState by 1 tick
+
+        arguments:
+            flap        (bool)  - whether or not the player flaps at the beginning of the tick
+        returns:
+            state       (GameState) - new game state, None if the player crashes
+        """
+        crash, player_y, player_vel_y, shift = self.simulate(flap)
+        if crash:
+            return None
+        return self.child(player_y, player_vel_y, shift)
+
+    def nextStep(self, flap):
+        """
+        only get the next step without mutation of the global state
+        needed for look-ahead in multi-threaded approach
+
+        by default this only returns the next GameState() object
+
+        arguments:
+            flap        (bool)  - whether or not to flap when starting the simulation
+        returns:
+            state       (GameState) - new game state, at the moment of the crash if crashed
+        """
+        _, player_y, player_vel_y, shift = self.simulate(flap)
+        return self.child(player_y, player_vel_y, shift)
+
+    def getScore(self):
+        """
+        returns the score of the current GameState
+
+        arguments:
+            none
+        returns:
+            score        (float) - score corresponding to this GameState
+        """
+        goal, cutoff = self.scoreParameters(self.shift)
+        displacement = abs(goal - self.player_y)
+
+        return scoreFunction(displacement, cutoff)
+
+    def scoreParameters(self, shift):
+        """returns getScoreParameters of the pipes moved by shift, cached for all states sharing them"""
+        try:
+            return self.score_parameters[shift]
+        except KeyError:
+            parameters = self.score_parameters[shift] = getScoreParameters(self.upper_pipes, shift)
+            return parameters
+
+    def pipeKey(self):
+        """
+        returns the positions of the pipes still ahead of the player; states built
+        from different snapshots share the key when they see the same pipes at the
+        same place, as passed pipes can't influence the future anymore
+
+        arguments:
+            none
+        returns:
+            key          (tuple) - x and y of every upper pipe ahead of the player
+        """
+        try:
+            return self.pipe_keys[self.shift]
+        except KeyError:
+            key = tuple((int(p['x'] + self.shift), p['y']) for p in self.upper_pipes
+                        if PLAYER_X < p['x'] + self.shift + PIPE_WIDTH)
+            self.pipe_keys[self.shift] = key
+            return key
+
+    def fallbackGoalKey(self, ticks):
+        """
+        returns what the scores of the next ticks depend on besides pipeKey(): once
+        every pipe ahead is passed, getScoreParameters aims at the gap of the first
+        listed pipe, a passed one that pipeKey() leaves out
+
+        arguments:
+            ticks        (int) - number of ticks scored from this state on
+        returns:
+            key          (int) - y of the first upper pipe if it becomes the goal within ticks, None otherwise
+        """
+        ahead = self.pipeKey()
+        if ahead and PLAYER_X < ahead[-1][0] + ticks * FRAME_SKIP * PIPE_VEL_X + PIPE_WIDTH:
+            return None
+        return self.upper_pipes[0]['y']
+
+def getScoreParameters(upperPipes, shift=0):
+    """
+    returns the height the player should aim for and the width of the score distribution
+    for the given pipes; they are the same for every player position
+
+    arguments:
+        upperPipes   (list)  - upper pipes of the GameState
+        shift        (int)   - distance the pipes moved since, added to their x
+    returns:
+        goal         (float) - y position with the highest score
+        cutoff       (float) - width of the score distribution
+    """
+    goal = SCREENHEIGHT / 2
+
+    leftest_pipe_u = min(upperPipes, key=lambda p: p['x'] + shift if PLAYER_X < p['x'] + shift + PIPE_WIDTH else np.inf)
+    u_lower_bound = leftest_pipe_u['y'] + PIPE_HEIGHT
+
+    if leftest_pipe_u['x'] + shift < SCREENWIDTH:
+        goal = u_lower_bound + PIPEGAPSIZE/2
+
+    cutoff = PIPEGAPSIZE/2
+    for p in upperPipes:
+        if p['x'] + shift < PLAYER_X < p['x'] + shift + PIPE_WIDTH:
+            cutoff = PIPEGAPSIZE/2 - PLAYER_HEIGHT/2
+
+    return goal, cutoff
+
+def getRandomGap(rng=random):
+    """returns the y of the gap of a new pipe, drawn from the random generator rng"""
+    gapY = rng.randrange(0, int(BASEY * 0.6 - PIPEGAPSIZE))
+    gapY += int(BASEY * 0.2)
+    return gapY
+
+def getRandomPipe(gaps=None):
+    """returns a randomly generated pipe, its gap taken from the iterator gaps if given"""
+    # y of gap between upper and lower pipe
+    gapY = getRandomGap() if gaps is None else next(gaps)
+    pipeX = SCREENWIDTH + 10
+
+    return [
+        {'x': pipeX, 'y': gapY - PIPE_HEIGHT},  # upper pipe
+        {'x': pipeX, 'y': gapY + PIPEGAPSIZE}, # lower pipe
+    ]
+
+def getInitialPipes(gaps=None):
+    """returns the upper and lower pipe lists a new game starts with, see getRandomPipe for gaps"""
+    # get 2 new pipes to add to upperPipes lowerPipes list
+    newPipe1 = getRandomPipe(gaps)
+    newPipe2 = getRandomPipe(gaps)
+
+    # list of upper pipes
+    upperPipes = [
+        {'x': SCREENWIDTH + 200, 'y': newPipe1[0]['y']},
+        {'x': SCREENWIDTH + 200 + (SCREENWIDTH / 2), 'y': newPipe2[0]['y']},
+    ]
+
+    # list of lowerpipe
+    lowerPipes = [
+        {'x': SCREENWIDTH + 200, 'y': newPipe1[1]['y']},
+        {'x': SCREENWIDTH + 200 + (SCREENWIDTH / 2), 'y': newPipe2[1]['y']},
+    ]
+
+    return upperPipes, lowerPipes
+
+def movePipes(upperPipes, lowerPipes, gaps=None):
+    """moves the pipes one frame to the left, spawning and removing pipes as needed, see getRandomPipe for gaps"""
+    for uPipe, lPipe in zip(upperPipes, lowerPipes):
+        uPipe['x'] += PIPE_VEL_X
+        lPipe['x'] += PIPE_VEL_X
+
+    # add new pipe when first pipe is about to touch left of screen
+    if 0 < upperPipes[0]['x'] < 5:
+        newPipe = getRandomPipe(gaps)
+        upperPipes.append(newPipe[0])
+        lowerPipes.append(newPipe[1])
+
+    # remove first pipe if its out of the screen
+    if upperPipes[0]['x'] < -PIPE_WIDTH:
+        upperPipes.pop(0)
+        lowerPipes.pop(0)
+
+def countPassedPipes(upperPipes):
+    """returns the number of pipes the player passes in this frame"""
+    passed = 0
+    playerMidPos = PLAYER_X + PLAYER_WIDTH / 2
+    for pipe in upperPipes:
+        pipeMidPos = pipe['x'] + PIPE_WIDTH / 2
+        if pipeMidPos <= playerMidPos < pipeMidPos + 4:
+            passed += 1
+    return passed
+
+def checkCrash(player, upperPipes, lowerPipes):
+    """returns True if player collders with base or pipes."""
+    pi = player['index']
+    player['w'] = PLAYER_WIDTH
+    player['h'] = PLAYER_HEIGHT
+
+    counters = instrumentation.COUNTERS
+    if counters is not None:
+        counters['crash_checks'] += 1
+
+    # if player crashes into ground
+    if player['y'] + player['h'] >= BASEY - 1:
+        return [True, True]
+    else:
+        # offsets are truncated the same way pygame.Rect does
+        playerX, playerY = int(player['x']), int(player['y'])
+
+        for uPipe, lPipe in zip(upperPipes, lowerPipes):
+            # bounding boxes apart horizontally, no need to look at the hitmasks
+            dx = int(uPipe['x']) - playerX + PIPE_WIDTH - 1
+            if not 0 <= dx < PLAYER_WIDTH + PIPE_WIDTH - 1:
+                if counters is not None:
+                    counters['bbox_rejects'] += 2
+                continue
+            if counters is not None:
+                counters['pixel_collisions'] += 2
+
+            # if bird collided with upipe or lpipe
+            uCollide = tableCollision(pi, 0, dx, int(uPipe['y']) - playerY + PIPE_HEIGHT - 1)
+            lCollide = tableCollision(pi, 1, dx, int(lPipe['y']) - playerY + PIPE_HEIGHT - 1)
+
+            if uCollide or lCollide:
+                return [True, False]
+
+    return [False, False]
+
+def checkCrashAnyFrame(player_y, upperPipes, lowerPipes, shift=0):
+    """
+    returns True if the player collides with base or pipes in any of its three frames
+
+    arguments:
+        player_y     (float) - y position of the player
+        upperPipes   (list)  - upper pipes
+        lowerPipes   (list)  - lower pipes
+        shift        (int)   - distance the pipes moved since, added to their x
+    returns:
+        crash        (bool)  - whether the player crashes
+    """
+    counters = instrumentation.COUNTERS
+    if counters is not None:
+        counters['crash_checks'] += 1
+
+    if player_y + PLAYER_HEIGHT >= BASEY - 1:
+        return True
+
+    playerY = int(player_y)
+    tableHeight = PLAYER_HEIGHT + PIPE_HEIGHT - 1
+
+    for uPipe, lPipe in zip(upperPipes, lowerPipes):
+        # bounding boxes apart horizontally or vertically, no need to look at the hitmasks
+        dx = int(uPipe['x'] + shift) - PLAYER_X + PIPE_WIDTH - 1
+        if not 0 <= dx < PLAYER_WIDTH + PIPE_WIDTH - 1:
+            if counters is not None:
+                counters['bbox_rejects'] += 2
+            continue
+
+        for pipe, p in enumerate((uPipe, lPipe)):
+            dy = int(p['y']) - playerY + PIPE_HEIGHT - 1
+            if not 0 <= dy < tableHeight:
+                if counters is not None:
+                    counters['bbox_rejects'] += 1
+                continue
+            if counters is not None:
+                counters['pixel_collisions'] += 1
+            if COLLISION_TABLE_ANY[pipe, dx, dy]:
+                return True
+
+    return False
+
+def checkCrashBatch(player_y, upperPipes, lowerPipes, shift=0):
+    """
+    vectorized checkCrash for many player positions sharing the same pipes, a
+    player crashes if any of its three frames collides
+
+    arguments:
+        player_y     (ndarray) - y positions of the players
+        upperPipes   (list)    - upper pipes
+        lowerPipes   (list)    - lower pipes
+        shift        (int)     - distance the pipes moved since, added to their x
+    returns:
+        crash        (ndarray) - boolean array, True where the player crashes
+    """
+    counters = instrumentation.COUNTERS
+    if counters is not None:
+        counters['crash_checks'] += len(player_y)
+
+    crash = player_y + PLAYER_HEIGHT >= BASEY - 1
+    playerY = np.trunc(player_y).astype(int)
+    tableHeight = PLAYER_HEIGHT + PIPE_HEIGHT - 1
+
+    for uPipe, lPipe in zip(upperPipes, lowerPipes):
+        # bounding boxes apart horizontally for every player, no need to look at the hitmasks
+        dx = int(uPipe['x'] + shift) - PLAYER_X + PIPE_WIDTH - 1
+        if not 0 <= dx < PLAYER_WIDTH + PIPE_WIDTH - 1:
+            if counters is not None:
+                counters['bbox_rejects'] += 2 * len(player_y)
+            continue
+
+        if counters is not None:
+            counters['pixel_collisions'] += 2 * len(player_y)
+
+        for pipe, p in enumerate((uPipe, lPipe)):
+            dy = int(p['y']) - playerY + PIPE_HEIGHT - 1
+            inside = (dy >= 0) & (dy < tableHeight)
+            crash |= inside & COLLISION_TABLE_ANY[pipe, dx, np.clip(dy, 0, tableHeight - 1)]
+
+    return crash
+
+def tableCollision(index, pipe, dx, dy):
+    """
+    Looks up whether player frame index and the pipe collide, offsets as in buildCollisionTable
+
+    arguments:
+        index        (int)  - frame of the player
+        pipe         (int)  - 0 for the upper, 1 for the lower pipe
+        dx           (int)  - horizontal table offset, already known to be inside the table
+        dy           (int)  - vertical table offset
+    returns:
+        collide      (bool) - whether both hitmasks overlap
+    """
+    if not 0 <= dy < PLAYER_HEIGHT + PIPE_HEIGHT - 1:
+        return False
+    return COLLISION_TABLE[index, pipe, dx, dy]
+
+def pixelCollision(rect1, rect2, hitmask1, hitmask2):
+    """Checks if two objects collide and not just their rects"""
+    if instrumentation.COUNTERS is not None:
+        instrumentation.COUNTERS['pixel_collisions'] += 1
+
+    rect = rect1.clip(rect2)
+
+    if rect.width == 0 or rect.height == 0:
+        return False
+
+    x1, y1 = rect.x - rect1.x, rect.y - rect1.y
+    x2, y2 = rect.x - rect2.x, rect.y - rect2.y
+
+    return bool(np.any(hitmask1[x1:x1+rect.width, y1:y1+rect.height] &
+                       hitmask2[x2:x2+rect.width, y2:y2+rect.height]))
+
+def playGame(agent, verbose=0, max_frames=None, profiler=None, recording=None, trajectory=None):
+    """
+    Plays a single game without any display, sound or frame clock, as fast as
+    the CPU allows. The rules are the same as in flappy.mainGame.
+
+    arguments:
+        agent      (Agent) - agent deciding whether to flap
+        verbose    (int)   - verbosity level
+        max_frames (int)   - stop the game after this many frames, None to play until the crash
+        profiler   (Profiler) - records the time spent deciding and simulating, None to not profile
+        recording  (Recording) - records the pipe gaps and flaps of the game, None to not record
+        trajectory (Trajectory) - records every decision of the agent, None to not record
+    returns:
+        crashInfo  (dict)  - final state of the game, keys of flappy.mainGame and the number of decisions
+    """
+    score = playerIndex = loopIter = 0
+    playerIndexGen = cycle([0, 1, 2, 1])
+    playery = int((SCREENHEIGHT - PLAYER_HEIGHT) / 2)
+
+    gaps = None
+    if recording:
+        recording.player_y = playery
+        gaps = recording.recordGaps()
+    upperPipes, lowerPipes = getInitialPipes(gaps)
+
+    playerFlapped = False # True when player flaps
+    frame_count = decisions = 0
+    player_vel_y = PLAYER_VEL_Y
+
+    while max_frames is None or frame_count < max_frames:
+        if profiler:
+            profiler.startFrame()
+
+        if playery > -2 * PLAYER_HEIGHT:
+            if not frame_count % AGENT_FREQ:
+                state = GameState(playery, player_vel_y, upperPipes, lowerPipes)
+                flap, optimal_path = agent.findBestDecision(state)
+                decisions += 1
+                if trajectory:
+                    trajectory.addDecision(frame_count, state, flap, optimal_path)
+                if profiler:
+                    profiler.endDecision()
+                if flap:
+                    player_vel_y = PLAYER_FLAP_ACC
+                    playerFlapped = True
+                if verbose > 2:
+                    print("DEBUG_agent; flap: {} path: {}".format(flap, optimal_path))
+                if verbose > 1:
+                    print("DEBUG_agent; {}".format(agent.statistics()))
+        if profiler:
+            profiler.mark('agent')
+        if recording:
+            recording.addFrame(playerFlapped)
+
+        # check for crash here
+        crashTest = checkCrash({'x': PLAYER_X, 'y': playery, 'index': playerIndex},
+                               upperPipes, lowerPipes)
+        if crashTest[0]:
+            break
+
+        # check for score
+        score += countPassedPipes(upperPipes)
+
+        # playerIndex change
+        if (loopIter + 1) % 3 == 0:
+            playerIndex = next(playerIndexGen)
+        loopIter = (loopIter + 1) % 30
+
+        # player's movement
+        if player_vel_y < PLAYER_MAX_VEL_Y and not playerFlapped:
+            player_vel_y += PLAYER_ACC_Y
+        playerFlapped = False
+
+        playery += min(player_vel_y, BASEY - playery - PLAYER_HEIGHT)
+
+        movePipes(upperPipes, lowerPipes, gaps)
+
+        frame_count += 1
+        if profiler:
+            profiler.mark('simulate')
+    else:
+        crashTest = [False, False]
+
+    return {
+        'y': playery,
+        'groundCrash': crashTest[1],
+        'upperPipes': upperPipes,
+        'lowerPipes': lowerPipes,
+        'score': score,
+        'player_vel_y': player_vel_y,
+        'frames': frame_count,
+        'decisions': decisions,
+    }
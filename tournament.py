@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# (C) 2018 Lukas Pilz & Conrad Sachweh
+
+"""NAME
+        %(prog)s - evaluates a planner on many headless games
+
+SYNOPSIS
+        %(prog)s [--help]
+
+DESCRIPTION
+        Plays M headless games of one planner, spread over a pool of
+        processes. Every game gets its own seed derived from --seed,
+        so a game and its score can be reproduced independent of the
+        number of workers. Each finished game is written as one JSON
+        line, followed by a summary line with the score distribution,
+        mean, median, max, games/sec and decisions/sec. With
+        --trajectories every decision of every game is appended to a
+        trajectory dataset as well.
+
+AUTHOR
+        Lukas Pilz, <email>
+        Conrad Sachweh, conrad@csachweh.de
+"""
+
+import concurrent.futures
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+
+# keep stdout, inherited by the workers, free for the JSON lines
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+from simulation import playGame
+from agent import PLANNERS
+from trajectories import Trajectory, TrajectoryWriter
+
+def gameSeed(seed, game):
+    """returns the seed of the pipe generator for the game-th game of a tournament"""
+    return random.Random(seed * 1000003 + game).getrandbits(32)
+
+def playTournamentGame(planner, game, seed, max_frames, record=False):
+    """
+    Plays a single game of the tournament, runs in a worker process
+
+    arguments:
+        planner      (str)  - name of the planner in agent.PLANNERS
+        game         (int)  - number of the game in the tournament
+        seed         (int)  - seed of the pipe generator
+        max_frames   (int)  - stop the game after this many frames, None to play until the crash
+        record       (bool) - whether to return the decisions of the game as well
+    returns:
+        result       (dict) - score, frames, decisions and duration of the game, with record
+                              the array of trajectories.RECORD as 'trajectory'
+    """
+    # a fresh agent, so no transpositions of earlier games of this worker change the result
+    agent = PLANNERS[planner]()
+    trajectory = Trajectory(seed) if record else None
+    random.seed(seed)
+    start = time.perf_counter()
+    crashInfo = playGame(agent, max_frames=max_frames, trajectory=trajectory)
+    duration = time.perf_counter() - start
+    agent.close()
+
+    result = {
+        'type': 'game',
+        'game': game,
+        'seed': seed,
+        'score': crashInfo['score'],
+        'frames': crashInfo['frames'],
+        'decisions': crashInfo['decisions'],
+        'ground_crash': bool(crashInfo['groundCrash']),
+        'seconds': duration,
+    }
+    if record:
+        result['trajectory'] = trajectory.records()
+    return result
+
+def summarizeTournament(planner, results, duration):
+    """
+    aggregates the results of all games
+
+    arguments:
+        planner      (str)   - name of the planner
+        results      (list)  - results of playTournamentGame
+        duration     (float) - wall clock time of the tournament in seconds
+    returns:
+        summary      (dict)  - score distribution and throughput
+    """
+    scores = [result['score'] for result in results]
+    return {
+        'type': 'summary',
+        'planner': planner,
+        'games': len(results),
+        'mean': statistics.mean(scores),
+        'median': statistics.median(scores),
+        'max': max(scores),
+        'min': min(scores),
+        'stdev': statistics.pstdev(scores),
+        'scores': {str(score): count for score, count in sorted(Counter(scores).items())},
+        'seconds': duration,
+        'games_per_sec': len(results) / duration,
+        'decisions_per_sec': sum(result['decisions'] for result in results) / duration,
+    }
+
+def runTournament(args, output):
+    """
+    plays all games of the tournament and writes every result to output as soon as it is known
+
+    arguments:
+        args         (Namespace) - parsed command line
+        output       (file)      - stream the JSON lines are written to
+    returns:
+        summary      (dict)      - see summarizeTournament
+    """
+    results = []
+    writer = TrajectoryWriter(args.trajectories) if args.trajectories else None
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(playTournamentGame, args.planner, game, gameSeed(args.seed, game), args.max_frames,
+                               writer is not None)
+                   for game in range(args.games)]
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            if writer:
+                writer.extend(result.pop('trajectory'))
+                writer.flush()
+            results.append(result)
+            output.write(json.dumps(result) + '\n')
+            output.flush()
+            if args.verbose:
+                print("game {game}: score {score} after {frames} frames".format(**result), file=sys.stderr)
+
+    if writer:
+        writer.close()
+    summary = summarizeTournament(args.planner, results, time.perf_counter() - start)
+    output.write(json.dumps(summary) + '\n')
+    output.flush()
+    return summary
+
+def main(args):
+    args = parse_args(args)
+    if args.output:
+        with open(args.output, 'a') as output:
+            summary = runTournament(args, output)
+    else:
+        summary = runTournament(args, sys.stdout)
+
+    if args.verbose:
+        print("mean score: {mean:.1f}, median: {median}, max: {max}, {games_per_sec:.2f} games/sec, "
+              "{decisions_per_sec:.0f} decisions/sec".format(**summary), file=sys.stderr)
+
+def parse_args(args):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="MyOptions")
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help='show progress on stderr')
+    parser.add_argument('--planner', choices=sorted(PLANNERS), default='tree',
+                        help='search used by the agent')
+    parser.add_argument('--games', type=int, default=100,
+                        help='number of games to play, at least 1')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='number of processes the games are spread over')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed the seeds of all games are derived from')
+    parser.add_argument('--max-frames', type=int, default=None,
+                        help='end a game after this many frames')
+    parser.add_argument('-o', '--output',
+                        help='append the JSON lines to this file instead of stdout')
+    parser.add_argument('--trajectories', metavar='DIR',
+                        help='append every decision to the trajectory dataset in DIR')
+
+    args = parser.parse_args(args[1:])
+    if args.games < 1:
+        parser.error("--games must be at least 1")
+    return args
+
+if __name__ == '__main__':
+    main(sys.argv[:])
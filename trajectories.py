@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+# (C) 2018 Lukas Pilz & Conrad Sachweh
+
+"""
+Datasets of the decisions of the agent, for training and analysis. A dataset
+is a directory holding one raw little endian file per column of RECORD and
+META, a JSON file with the columns and the number of rows. The writer maps
+the column files into memory and grows them chunk by chunk, the reader maps
+a column only when it is first accessed, so neither holds the decisions in
+RAM no matter how many there are.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from simulation import PLAYER_X, PIPE_WIDTH, PIPE_HEIGHT
+
+# one decision: the game, identified by the seed of its pipes, and the frame it was taken in, the player, the next two pipes ahead of the player,
+# the decision and the score of the best path the search found, NaN without any path
+RECORD = np.dtype([
+    ('game', '<u4'),
+    ('frame', '<u4'),
+    ('player_y', '<f8'),
+    ('player_vel_y', '<i2'),
+    ('pipe0_x', '<f4'),
+    ('pipe0_gap_y', '<i2'),
+    ('pipe1_x', '<f4'),
+    ('pipe1_gap_y', '<i2'),
+    ('flap', '?'),
+    ('path_score', '<f8'),
+])
+
+# rows the column files grow by at once
+CHUNK_ROWS = 1 << 16
+META = 'meta.json'
+VERSION = 1
+
+def nextPipes(state):
+    """returns x and the y of the gap top of the first two pipes of state the player has not passed yet, x NaN if missing"""
+    pipes = [(uPipe['x'] + state.shift, uPipe['y'] + PIPE_HEIGHT) for uPipe in state.upper_pipes
+             if uPipe['x'] + state.shift + PIPE_WIDTH > PLAYER_X]
+    # a state predicted ahead of the game, with a shift, does not know the pipe spawning meanwhile
+    return pipes[:2] + [(np.nan, 0)] * (2 - len(pipes))
+
+class Trajectory():
+    """
+    The decisions of a single game, kept in memory while it is played; pass it
+    to simulation.playGame and add the records() to a TrajectoryWriter.
+    """
+    def __init__(self, seed=0):
+        self.game = seed
+        self.rows = []
+
+    def addDecision(self, frame, state, flap, path):
+        """
+        records a decision of the agent
+
+        arguments:
+            frame        (int)       - frame of the game the decision was taken in
+            state        (GameState) - state the agent decided on
+            flap         (bool)      - the decision
+            path         (list)      - paths returned by findBestDecision, best first
+        returns:
+            none
+        """
+        (pipe0_x, pipe0_gap_y), (pipe1_x, pipe1_gap_y) = nextPipes(state)
+        self.rows.append((self.game, frame, state.player_y, state.player_vel_y, pipe0_x, pipe0_gap_y,
+                          pipe1_x, pipe1_gap_y, bool(flap), path[0][0] if path else np.nan))
+
+    def records(self):
+        """returns the decisions as an array of RECORD"""
+        return np.array(self.rows, dtype=RECORD)
+
+class TrajectoryWriter():
+    """
+    Appends records to a dataset, creating it if needed. The rows become
+    visible to readers on flush() and close().
+    """
+    def __init__(self, path, chunk_rows=CHUNK_ROWS):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.rows = 0
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, META)):
+            meta = readMeta(path)
+            if meta['columns'] != describeColumns():
+                raise ValueError("{} holds other columns than RECORD".format(path))
+            self.rows = meta['rows']
+        self.capacity = 0
+        self.columns = {}
+        self.grow(self.rows)
+
+    def columnPath(self, name):
+        """returns the path of the file of column name"""
+        return os.path.join(self.path, name + '.bin')
+
+    def grow(self, rows):
+        """maps the column files with room for at least rows rows, in whole chunks"""
+        capacity = -(-max(rows, 1) // self.chunk_rows) * self.chunk_rows
+        if capacity <= self.capacity:
+            return
+        self.columns.clear()
+        for name in RECORD.names:
+            dtype = RECORD.fields[name][0]
+            with open(self.columnPath(name), 'ab') as column:
+                column.truncate(capacity * dtype.itemsize)
+            self.columns[name] = np.memmap(self.columnPath(name), dtype=dtype, mode='r+', shape=(capacity,))
+        self.capacity = capacity
+
+    def extend(self, records):
+        """appends an array of RECORD, e.g. Trajectory.records()"""
+        end = self.rows + len(records)
+        self.grow(end)
+        for name, column in self.columns.items():
+            column[self.rows:end] = records[name]
+        self.rows = end
+
+    def flush(self):
+        """writes the rows appended so far to disk and makes them visible to readers"""
+        for column in self.columns.values():
+            column.flush()
+        writeMeta(self.path, self.rows)
+
+    def close(self):
+        """flushes and cuts the column files to the rows written"""
+        self.flush()
+        self.columns.clear()
+        for name in RECORD.names:
+            os.truncate(self.columnPath(name), self.rows * RECORD.fields[name][0].itemsize)
+
+class TrajectoryReader():
+    """
+    Read only view of a dataset. reader[name] returns the column as an array
+    mapped from disk, reader[start:stop] the rows in between as an array of
+    RECORD; the rows appended after opening the reader are not included.
+    """
+    def __init__(self, path):
+        self.path = path
+        meta = readMeta(path)
+        self.rows = meta['rows']
+        self.dtypes = {name: np.dtype(dtype) for name, dtype in meta['columns']}
+        self.columns = {}
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key not in self.columns:
+                if self.rows:
+                    self.columns[key] = np.memmap(os.path.join(self.path, key + '.bin'), dtype=self.dtypes[key],
+                                                  mode='r', shape=(self.rows,))
+                else:
+                    self.columns[key] = np.zeros(0, dtype=self.dtypes[key])
+            return self.columns[key]
+        start, stop, _ = key.indices(self.rows)
+        records = np.zeros(max(stop - start, 0), dtype=RECORD)
+        for name in RECORD.names:
+            records[name] = self[name][start:stop]
+        return records
+
+    def names(self):
+        """returns the names of the columns"""
+        return list(self.dtypes)
+
+def describeColumns():
+    """returns name and dtype of every column of RECORD, as stored in META"""
+    return [[name, RECORD.fields[name][0].str] for name in RECORD.names]
+
+def readMeta(path):
+    """returns the META of the dataset at path"""
+    with open(os.path.join(path, META)) as meta:
+        meta = json.load(meta)
+    if meta.get('version') != VERSION:
+        raise ValueError("{} is no trajectory dataset of version {}".format(path, VERSION))
+    return meta
+
+def writeMeta(path, rows):
+    """replaces the META of the dataset at path at once, so readers never see a partial one"""
+    temporary = os.path.join(path, META + '.tmp')
+    with open(temporary, 'w') as meta:
+        json.dump({'version': VERSION, 'rows': rows, 'columns': describeColumns()}, meta)
+    os.replace(temporary, os.path.join(path, META))